@@ -0,0 +1,71 @@
+# answer_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    sources: List[Any]
+    confidence: float
+    created_at: float = field(default_factory=time.time)
+
+class SemanticAnswerCache:
+    """In-memory cache of answers, looked up by question embedding similarity.
+
+    Entries are grouped by a scope key (e.g. language and retrieval settings) and
+    all of them are dropped whenever the underlying collection changes.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, max_entries_per_scope: int = 256):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self._lock = threading.Lock()
+        self._scopes = {}
+        # Bumped on every invalidation so answers computed against old data are not stored
+        self.generation = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question_embedding: Sequence[float], scope: Hashable) -> Optional[CachedAnswer]:
+        """Returns the cached answer for the most similar prior question above the threshold."""
+        query = self._normalize(question_embedding)
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if not entries:
+                return None
+            keys = list(entries)
+            matrix = np.stack([entries[key][0] for key in keys])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+            entries.move_to_end(keys[best])
+            return entries[keys[best]][1]
+
+    def put(self, question_embedding: Sequence[float], scope: Hashable, answer: CachedAnswer, generation: int):
+        """Stores an answer unless the collection changed since generation was read."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            entries = self._scopes.setdefault(scope, OrderedDict())
+            entries[answer.question] = (self._normalize(question_embedding), answer)
+            entries.move_to_end(answer.question)
+            while len(entries) > self.max_entries_per_scope:
+                entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drops every cached answer."""
+        with self._lock:
+            self._scopes.clear()
+            self.generation += 1
@@ -0,0 +1,77 @@
+# benchmarks/bench_providers.py
+"""Benchmarks provider lookups against large synthetic provider files.
+
+    python benchmarks/bench_providers.py --providers 100000 --lookups 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from provider_database import ProviderIndex  # noqa: E402
+
+CITIES = ["Berlin", "Munich", "Hamburg", "Cologne", "Frankfurt", "Stuttgart", "Leipzig", "Dresden"]
+
+def write_synthetic_providers(path: str, count: int, vocabulary_size: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    vocabulary = [f"symptom {i}" for i in range(vocabulary_size)]
+    providers = [
+        {
+            "name": f"Provider {i}",
+            "type_of_practice": "Synthetic Practice",
+            "keywords": rng.sample(vocabulary, 4),
+            "location": rng.choice(CITIES),
+        }
+        for i in range(count)
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(providers, f)
+    return vocabulary
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=5_000, help="number of distinct keywords")
+    parser.add_argument("--lookups", type=int, default=2_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "providers.json")
+        vocabulary = write_synthetic_providers(path, args.providers, args.vocabulary)
+        index = ProviderIndex(path)
+
+        start = time.perf_counter()
+        index.refresh()
+        build_seconds = time.perf_counter() - start
+
+        rng = random.Random(1)
+        latencies = []
+        for _ in range(args.lookups):
+            keywords = rng.sample(vocabulary, 2)
+            location = rng.choice(CITIES + [None])
+            start = time.perf_counter()
+            index.find(keywords, location)
+            latencies.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        "providers": args.providers,
+        "build_seconds": build_seconds,
+        "lookup_ms_p50": percentile(latencies, 0.50) * 1000,
+        "lookup_ms_p95": percentile(latencies, 0.95) * 1000,
+        "lookup_ms_p99": percentile(latencies, 0.99) * 1000,
+        "lookup_ms_mean": statistics.mean(latencies) * 1000,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
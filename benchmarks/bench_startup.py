@@ -0,0 +1,70 @@
+# benchmarks/bench_startup.py
+"""Measures cold-start import time of the app modules and, optionally, first-query latency.
+
+Each run starts a fresh interpreter so nothing is cached in-process. Run from the
+repository root (config.yaml is read from the working directory):
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 3 --query "What is this document about?"
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP_MODULES = ["vector_store", "document_processing", "llm_interface", "utils", "provider_database"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {modules}
+result = {{"import_seconds": time.perf_counter() - start}}
+heavy = ["chromadb", "sentence_transformers", "langchain", "ollama", "deep_translator", "docx", "bs4"]
+result["heavy_modules_loaded"] = [name for name in heavy if name in sys.modules]
+query = {query!r}
+if query:
+    from vector_store import query_collection
+    from utils import re_rank_cross_encoders
+    start = time.perf_counter()
+    results = query_collection(query, 10)
+    if results:
+        re_rank_cross_encoders(query, results["documents"][0], ids=results["ids"][0])
+    result["first_query_seconds"] = time.perf_counter() - start
+print(json.dumps(result))
+"""
+
+def run_probe(query: str) -> dict:
+    code = PROBE.format(modules=", ".join(APP_MODULES), query=query)
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters to measure")
+    parser.add_argument("--query", default="", help="also time the first retrieval + rerank for this question")
+    args = parser.parse_args()
+
+    runs = [run_probe(args.query) for _ in range(args.runs)]
+    report = {
+        "runs": args.runs,
+        "import_seconds_median": statistics.median(run["import_seconds"] for run in runs),
+        "import_seconds_max": max(run["import_seconds"] for run in runs),
+        "heavy_modules_loaded_at_import": runs[0]["heavy_modules_loaded"],
+    }
+    if args.query:
+        report["first_query_seconds_median"] = statistics.median(run["first_query_seconds"] for run in runs)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
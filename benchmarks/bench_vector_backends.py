@@ -0,0 +1,176 @@
+# benchmarks/bench_vector_backends.py
+"""Compares vector store backends on the same synthetic embeddings.
+
+Each backend is built and then queried in fresh interpreters, so reopen time and
+peak RSS are measured from a cold start. Embeddings are drawn around random
+cluster centers to resemble real text embeddings; recall@k is measured against
+exact float32 search.
+
+    python benchmarks/bench_vector_backends.py --vectors 200000 --dim 768
+    python benchmarks/bench_vector_backends.py --backends chroma numpy:int8 numpy:int8:256
+    python benchmarks/bench_vector_backends.py --backends numpy:int8 --shards 4
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def parse_backend(spec: str):
+    """'chroma', 'numpy:<dtype>' or 'numpy:<dtype>:<ivf lists>' -> (backend, options)."""
+    parts = spec.split(":")
+    if parts[0] == "chroma":
+        return "chroma", {}
+    options = {"dtype": parts[1] if len(parts) > 1 else "float16"}
+    if len(parts) > 2:
+        options["ivf_lists"] = int(parts[2])
+    return "numpy", options
+
+def make_data(directory: str, count: int, dim: int, queries: int, k: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(16, count // 1000), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    picks = rng.integers(count, size=queries)
+    query_vectors = vectors[picks] + 0.3 * rng.standard_normal((queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    truth = np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :k]
+    np.save(os.path.join(directory, "vectors.npy"), vectors)
+    np.save(os.path.join(directory, "queries.npy"), query_vectors)
+    np.save(os.path.join(directory, "truth.npy"), truth)
+
+def peak_rss_mb() -> float:
+    # VmHWM starts over at exec; ru_maxrss would include the parent's memory from before the fork
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def open_bench_collection(directory: str, spec: str, shards: int):
+    from vector_backends import open_collection, open_sharded_collection
+
+    backend, options = parse_backend(spec)
+    path = os.path.join(directory, "store")
+    if shards > 1:
+        return open_sharded_collection(backend, path, None, shards=shards, name="bench", **options)
+    return open_collection(backend, path, None, name="bench", **options)
+
+def worker_build(directory: str, spec: str, batch_size: int, shards: int) -> dict:
+    vectors = np.load(os.path.join(directory, "vectors.npy"))
+    start = time.perf_counter()
+    collection = open_bench_collection(directory, spec, shards)
+    for offset in range(0, len(vectors), batch_size):
+        batch = vectors[offset:offset + batch_size]
+        ids = [f"chunk_{i}" for i in range(offset, offset + len(batch))]
+        collection.upsert(
+            ids=ids,
+            embeddings=batch.tolist(),
+            documents=[f"document {i}" for i in range(offset, offset + len(batch))],
+            metadatas=[{"file_name": f"file_{i % 100}.pdf", "chunk": i} for i in range(offset, offset + len(batch))],
+        )
+    return {"build_seconds": time.perf_counter() - start}
+
+def worker_query(directory: str, spec: str, k: int, shards: int) -> dict:
+    start = time.perf_counter()
+    collection = open_bench_collection(directory, spec, shards)
+    queries = np.load(os.path.join(directory, "queries.npy"))
+    truth = np.load(os.path.join(directory, "truth.npy"))
+    collection.query(query_embeddings=[queries[0].tolist()], n_results=k)
+    first_query_seconds = time.perf_counter() - start
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        query_start = time.perf_counter()
+        result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=["distances"])
+        latencies.append(time.perf_counter() - query_start)
+        hits += len({int(chunk_id.rsplit("_", 1)[1]) for chunk_id in result["ids"][0]} & set(expected.tolist()))
+    return {
+        "open_and_first_query_seconds": first_query_seconds,
+        "query_p50_ms": percentile(latencies, 0.50) * 1000,
+        "query_p95_ms": percentile(latencies, 0.95) * 1000,
+        "query_mean_ms": statistics.mean(latencies) * 1000,
+        f"recall_at_{k}": hits / (len(queries) * k),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_worker(mode: str, directory: str, spec: str, args) -> dict:
+    output = subprocess.run(
+        [
+            sys.executable, os.path.abspath(__file__), "--worker", mode, "--data", directory,
+            "--backends", spec, "--k", str(args.k), "--batch-size", str(args.batch_size), "--shards", str(args.shards),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def directory_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1 << 20)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--shards", type=int, default=1, help="split every backend into this many shards")
+    parser.add_argument(
+        "--backends", nargs="+", default=["chroma", "numpy:float16", "numpy:int8", "numpy:int8:256"],
+        help="chroma, numpy:<float16|int8> or numpy:<dtype>:<ivf lists>",
+    )
+    parser.add_argument("--worker", choices=["build", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--data", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        spec = args.backends[0]
+        if args.worker == "build":
+            print(json.dumps(worker_build(args.data, spec, args.batch_size, args.shards)))
+        else:
+            print(json.dumps(worker_query(args.data, spec, args.k, args.shards)))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="rag-vector-bench-")
+    try:
+        make_data(workdir, args.vectors, args.dim, args.queries, args.k)
+        report = {"vectors": args.vectors, "dim": args.dim, "queries": args.queries, "shards": args.shards, "backends": {}}
+        for spec in args.backends:
+            shutil.rmtree(os.path.join(workdir, "store"), ignore_errors=True)
+            try:
+                result = run_worker("build", workdir, spec, args)
+                result.update(run_worker("query", workdir, spec, args))
+                result["disk_mb"] = directory_size_mb(os.path.join(workdir, "store"))
+            except subprocess.CalledProcessError as e:
+                result = {"error": e.stderr.strip().splitlines()[-1] if e.stderr else str(e)}
+            report["backends"][spec] = result
+            print(f"{spec}: {json.dumps(result)}", file=sys.stderr)
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/corpus.py
+"""Generates synthetic PDF, DOCX, TXT and HTML documents for benchmarks.
+
+Text is built from a fixed vocabulary with a seeded RNG, so the same sizes and
+seed always produce the same corpus. Some sentences mention part numbers and
+drug names so lexical retrieval has exact terms to find.
+"""
+
+import html
+import os
+import random
+from typing import Dict, List
+
+WORDS = (
+    "patient treatment dose clinical study result therapy symptom chronic acute pain "
+    "headache migraine tension muscle nerve blood pressure heart rate sleep stress "
+    "device sensor calibration voltage module firmware interface protocol latency "
+    "maintenance inspection schedule warranty component assembly torque bearing valve "
+    "report analysis method sample control group outcome effect risk benefit review"
+).split()
+TERMS = ["ibuprofen", "paracetamol", "sumatriptan", "PX-4410", "VK-208b", "AB-1234", "ZR-77"]
+
+# Number of pages (PDF) or paragraphs (other formats) per size
+SIZES = {"small": 5, "medium": 50, "large": 500}
+
+def make_paragraphs(count: int, rng: random.Random, sentences_per_paragraph: int = 8) -> List[str]:
+    paragraphs = []
+    for _ in range(count):
+        sentences = []
+        for _ in range(sentences_per_paragraph):
+            words = rng.choices(WORDS, k=rng.randint(8, 18))
+            if rng.random() < 0.1:
+                words.insert(rng.randrange(len(words)), rng.choice(TERMS))
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+    return paragraphs
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: str, pages: List[str], line_width: int = 90):
+    """Writes a minimal text-only PDF with one page per string (Helvetica, no compression)."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_numbers = []
+    for page_text in pages:
+        words, lines, line = page_text.split(), [], ""
+        for word in words:
+            if len(line) + len(word) + 1 > line_width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        lines.append(line)
+        commands = ["BT", "/F1 10 Tf", "12 TL", "50 760 Td"]
+        commands += [f"({_pdf_escape(text)}) Tj T*" for text in lines[:60]]
+        commands.append("ET")
+        stream = "\n".join(commands).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_number = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_number
+        )
+        page_numbers.append(len(objects))
+    kids = " ".join(f"{number} 0 R" for number in page_numbers).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_numbers)
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as f:
+        f.write(output)
+
+def write_docx(path: str, paragraphs: List[str]):
+    from docx import Document as DocxDocument
+
+    document = DocxDocument()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+def write_txt(path: str, paragraphs: List[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paragraphs))
+
+def write_html(path: str, paragraphs: List[str]):
+    body = "\n".join(f"<p>{html.escape(paragraph)}</p>" for paragraph in paragraphs)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"<html><head><title>Synthetic</title></head><body>{body}</body></html>")
+
+def generate_corpus(directory: str, sizes: List[str], formats: List[str], seed: int = 0) -> Dict[str, List[str]]:
+    """Writes one document per (size, format) and returns the file paths grouped by size."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    writers = {"pdf": write_pdf, "docx": write_docx, "txt": write_txt, "html": write_html}
+    corpus: Dict[str, List[str]] = {}
+    for size in sizes:
+        paragraphs = make_paragraphs(SIZES[size], rng)
+        for file_format in formats:
+            path = os.path.join(directory, f"{size}.{file_format}")
+            writers[file_format](path, paragraphs)
+            corpus.setdefault(size, []).append(path)
+    return corpus
+
+def sample_questions(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        words = rng.sample(WORDS, 5)
+        if rng.random() < 0.3:
+            words.append(rng.choice(TERMS))
+        questions.append(f"What does the document say about {' '.join(words)}?")
+    return questions
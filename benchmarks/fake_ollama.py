@@ -0,0 +1,152 @@
+# benchmarks/fake_ollama.py
+"""Local stand-in for the Ollama HTTP API with configurable latency.
+
+Serves /api/embed, /api/embeddings, /api/chat, /api/version and /api/tags.
+Embeddings are deterministic pseudo-random unit vectors derived from the text,
+so identical text always gets the same vector. Run standalone with:
+
+    python benchmarks/fake_ollama.py --port 11435 --embed-latency-ms 20 --token-latency-ms 15
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+class FakeOllamaSettings:
+    def __init__(
+        self,
+        dimensions: int = 384,
+        embed_latency_ms: float = 10.0,
+        embed_per_text_ms: float = 1.0,
+        first_token_latency_ms: float = 50.0,
+        token_latency_ms: float = 10.0,
+        answer_tokens: int = 120,
+    ):
+        self.dimensions = dimensions
+        self.embed_latency_ms = embed_latency_ms
+        self.embed_per_text_ms = embed_per_text_ms
+        self.first_token_latency_ms = first_token_latency_ms
+        self.token_latency_ms = token_latency_ms
+        self.answer_tokens = answer_tokens
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+def make_handler(settings: FakeOllamaSettings):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, payload, status=200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path == "/api/version":
+                self._send_json({"version": "0.0.0-fake"})
+            elif self.path == "/api/tags":
+                self._send_json({"models": [{"name": "fake-llm", "model": "fake-llm"}]})
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            body = self._read_json()
+            if self.path == "/api/embed":
+                texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                time.sleep((settings.embed_latency_ms + settings.embed_per_text_ms * len(texts)) / 1000)
+                self._send_json({
+                    "model": body.get("model"),
+                    "embeddings": [fake_embedding(text, settings.dimensions) for text in texts],
+                })
+            elif self.path == "/api/embeddings":
+                time.sleep((settings.embed_latency_ms + settings.embed_per_text_ms) / 1000)
+                self._send_json({"embedding": fake_embedding(body["prompt"], settings.dimensions)})
+            elif self.path == "/api/chat":
+                self._chat(body)
+            else:
+                self._send_json({"error": "not found"}, 404)
+
+        def _chat(self, body):
+            model = body.get("model", "fake-llm")
+            tokens = [f"token{i} " for i in range(settings.answer_tokens)]
+            time.sleep(settings.first_token_latency_ms / 1000)
+            final = {
+                "model": model,
+                "done": True,
+                "message": {"role": "assistant", "content": ""},
+                "eval_count": len(tokens),
+                "eval_duration": int(settings.token_latency_ms * len(tokens) * 1e6),
+            }
+            if not body.get("stream", True):
+                time.sleep(settings.token_latency_ms * len(tokens) / 1000)
+                final["message"]["content"] = "".join(tokens)
+                self._send_json(final)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(settings.token_latency_ms / 1000)
+                self._write_chunk({"model": model, "done": False, "message": {"role": "assistant", "content": token}})
+            self._write_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, payload):
+            line = json.dumps(payload).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+def start_fake_ollama(settings: FakeOllamaSettings, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Starts the server on a daemon thread; port 0 picks a free port (see server.server_address)."""
+    server = ThreadingHTTPServer((host, port), make_handler(settings))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dimensions", type=int, default=384)
+    parser.add_argument("--embed-latency-ms", type=float, default=10.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=1.0)
+    parser.add_argument("--first-token-latency-ms", type=float, default=50.0)
+    parser.add_argument("--token-latency-ms", type=float, default=10.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    args = parser.parse_args()
+    settings = FakeOllamaSettings(
+        dimensions=args.dimensions,
+        embed_latency_ms=args.embed_latency_ms,
+        embed_per_text_ms=args.embed_per_text_ms,
+        first_token_latency_ms=args.first_token_latency_ms,
+        token_latency_ms=args.token_latency_ms,
+        answer_tokens=args.answer_tokens,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(settings))
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# benchmarks/run_benchmarks.py
+"""End-to-end benchmark of ingestion and question answering against a fake Ollama server.
+
+Generates a synthetic corpus, starts benchmarks/fake_ollama.py in-process and runs
+the app code in a scratch directory with its own config.yaml and vector store, so
+nothing outside the temporary directory is touched and no real Ollama is needed.
+
+    python benchmarks/run_benchmarks.py --sizes small medium --queries 50
+    python benchmarks/run_benchmarks.py --save-baseline            # record benchmarks/baselines/default.json
+    python benchmarks/run_benchmarks.py --compare                  # exit 1 if slower than the baseline
+
+Stages reported (milliseconds, p50/p95/p99): process_document, add_to_vector_collection,
+query_collection, re_rank_cross_encoders, call_llm and call_llm_first_token, plus
+ingest docs/sec and chunks/sec.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+BASELINE_DIR = os.path.join(BENCH_DIR, "baselines")
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from corpus import SIZES, generate_corpus, sample_questions  # noqa: E402
+from fake_ollama import FakeOllamaSettings, start_fake_ollama  # noqa: E402
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 0.50) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+    }
+
+def write_config(workdir: str, ollama_base: str, args) -> None:
+    settings = {
+        "ollama_url": f"{ollama_base}/api/embeddings",
+        "embedding_model": "fake-embed",
+        "llm_model": "fake-llm",
+        "vector_store_path": os.path.join(workdir, "vector_store"),
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+    }
+    with open(os.path.join(workdir, "config.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(settings, f)
+
+def run_ingest(paths: List[str], args, timings: Dict[str, List[float]]) -> dict:
+    from document_processing import process_document
+    from ingestion_manifest import content_hash
+    from vector_store import add_to_vector_collection
+
+    total_chunks = 0
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, "rb") as f:
+            data = f.read()
+        file = io.BytesIO(data)
+        file.name = os.path.basename(path)
+
+        stage_start = time.perf_counter()
+        splits = process_document(file, args.chunk_size, args.chunk_overlap)
+        timings["process_document"].append(time.perf_counter() - stage_start)
+
+        stage_start = time.perf_counter()
+        add_to_vector_collection(splits, file.name, content_hash(data))
+        timings["add_to_vector_collection"].append(time.perf_counter() - stage_start)
+        total_chunks += len(splits)
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": len(paths),
+        "chunks": total_chunks,
+        "seconds": elapsed,
+        "docs_per_sec": len(paths) / elapsed,
+        "chunks_per_sec": total_chunks / elapsed,
+    }
+
+def run_queries(questions: List[str], args, timings: Dict[str, List[float]]) -> None:
+    from llm_interface import call_llm
+    from utils import load_cross_encoder_model, re_rank_cross_encoders
+    from vector_store import query_collection
+
+    rerank = not args.skip_rerank
+    if rerank:
+        try:
+            # Model loading is a one-off cost, keep it out of the per-query numbers
+            load_cross_encoder_model(args.rerank_max_length)
+        except Exception as e:
+            print(f"Skipping re_rank_cross_encoders, cross-encoder unavailable: {e}", file=sys.stderr)
+            rerank = False
+
+    for question in questions:
+        stage_start = time.perf_counter()
+        results = query_collection(question, args.n_results)
+        timings["query_collection"].append(time.perf_counter() - stage_start)
+        if not results or not results["documents"][0]:
+            continue
+        documents = results["documents"][0]
+
+        if rerank:
+            stage_start = time.perf_counter()
+            context, _, _ = re_rank_cross_encoders(
+                question, documents, ids=results["ids"][0], max_length=args.rerank_max_length
+            )
+            timings["re_rank_cross_encoders"].append(time.perf_counter() - stage_start)
+        else:
+            context = " ".join(documents[:3])
+
+        if len(timings["call_llm"]) < args.llm_calls:
+            metrics = {}
+            stage_start = time.perf_counter()
+            "".join(call_llm(context, question, "en", metrics=metrics))
+            timings["call_llm"].append(time.perf_counter() - stage_start)
+            if "time_to_first_token" in metrics:
+                timings["call_llm_first_token"].append(metrics["time_to_first_token"])
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns a description of every metric that got worse than the baseline by more than tolerance."""
+    regressions = []
+    for stage, stats in report["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if stats[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{stage} {key}: {old[key]:.2f} -> {stats[key]:.2f}")
+    for key in ("docs_per_sec", "chunks_per_sec"):
+        old = baseline.get("ingest", {}).get(key)
+        if old and report["ingest"][key] < old * (1 - tolerance):
+            regressions.append(f"ingest {key}: {old:.2f} -> {report['ingest'][key]:.2f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    parser.add_argument("--formats", nargs="+", choices=["pdf", "docx", "txt", "html"], default=["pdf", "docx", "txt", "html"])
+    parser.add_argument("--queries", type=int, default=50, help="number of retrieval queries")
+    parser.add_argument("--llm-calls", type=int, default=10, help="number of queries that also call the LLM")
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--rerank-max-length", type=int, default=512)
+    parser.add_argument("--skip-rerank", action="store_true", help="do not load the cross-encoder")
+    parser.add_argument("--embed-latency-ms", type=float, default=10.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=1.0)
+    parser.add_argument("--first-token-latency-ms", type=float, default=50.0)
+    parser.add_argument("--token-latency-ms", type=float, default=5.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--baseline", default="default", help="baseline name under benchmarks/baselines")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging (0.2 = 20%%)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = parser.parse_args()
+
+    server = start_fake_ollama(FakeOllamaSettings(
+        embed_latency_ms=args.embed_latency_ms,
+        embed_per_text_ms=args.embed_per_text_ms,
+        first_token_latency_ms=args.first_token_latency_ms,
+        token_latency_ms=args.token_latency_ms,
+        answer_tokens=args.answer_tokens,
+    ))
+    host, port = server.server_address[:2]
+    ollama_base = f"http://{host}:{port}"
+    os.environ["OLLAMA_HOST"] = ollama_base
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    previous_cwd = os.getcwd()
+    try:
+        corpus = generate_corpus(os.path.join(workdir, "corpus"), args.sizes, args.formats)
+        write_config(workdir, ollama_base, args)
+        # The app reads config.yaml from the working directory on first import
+        os.chdir(workdir)
+
+        timings: Dict[str, List[float]] = defaultdict(list)
+        paths = [path for size in args.sizes for path in corpus[size]]
+        ingest = run_ingest(paths, args, timings)
+        run_queries(sample_questions(args.queries), args, timings)
+    finally:
+        os.chdir(previous_cwd)
+        server.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": {
+            key: value for key, value in vars(args).items()
+            if key not in ("baseline", "save_baseline", "compare", "keep")
+        },
+        "ingest": ingest,
+        "stages": {stage: summarize(samples) for stage, samples in timings.items() if samples},
+    }
+    print(json.dumps(report, indent=2))
+
+    baseline_path = os.path.join(BASELINE_DIR, f"{args.baseline}.json")
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {baseline_path}", file=sys.stderr)
+    if args.compare:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["settings"] != report["settings"]:
+            print("Warning: baseline was recorded with different settings", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
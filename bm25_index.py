@@ -0,0 +1,387 @@
+# bm25_index.py
+
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+from heapq import nlargest
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from file_lock import exclusive_file_lock
+
+# Keeps compound terms such as part numbers ("AB-1234", "v2.1") intact
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases text and splits it into terms; compound terms also yield their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./]", token) if part)
+    return tokens
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _decode_postings(data: bytes) -> Iterator[Tuple[int, int]]:
+    """Yields (doc number, term frequency) from delta- and varint-encoded postings."""
+    doc_number = 0
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+        if len(values) == 2:
+            doc_number += values[0]
+            yield doc_number, values[1]
+            values = []
+
+class BM25Index:
+    """Incremental BM25 inverted index with compact postings, persisted as a snapshot and a change log.
+
+    Each term's postings are a byte string of varint-encoded (doc number delta, term
+    frequency) pairs. Removed chunks are tombstoned and dropped when the index is
+    compacted, which happens automatically once enough of them accumulate.
+    save() appends only the changes since the previous save to a log next to the
+    snapshot; the snapshot is rewritten, and the log emptied, once the log has
+    grown as large as the snapshot.
+
+    Several processes (the app, the service, ingest_cli.py) can share the files.
+    Reading and writing them takes an exclusive file lock, and before appending
+    its own changes a process applies the ones others logged since it last looked.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        k1: float = 1.5,
+        b: float = 0.75,
+        compact_ratio: float = 0.25,
+        max_df_ratio: float = 0.5,
+        log_ratio: float = 1.0,
+    ):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.lock_path = f"{path}.lock"
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self.max_df_ratio = max_df_ratio
+        self.log_ratio = log_ratio
+        # Lock order: _save_lock, then the file lock, then _lock
+        self._lock = threading.RLock()
+        # Serializes access to the files without blocking searches on disk I/O
+        self._save_lock = threading.Lock()
+        self._reset()
+        # Loaded on first use so importing the app does not pay for reading the index
+        self._loaded = False
+
+    def _reset(self):
+        self._chunk_ids: List[Optional[str]] = []
+        self._doc_numbers: Dict[str, int] = {}
+        self._doc_lengths = array("I")
+        self._postings: Dict[str, bytearray] = {}
+        self._last_doc: Dict[str, int] = {}
+        # Postings entries per term, removed chunks included until the next compaction
+        self._doc_freq: Dict[str, int] = {}
+        self._total_length = 0
+        self._deleted = 0
+        # Changes not written to the log yet, as ("add", chunk id, term counts) or ("remove", chunk id)
+        self._pending: List[tuple] = []
+        # Snapshot and log belong together only if their generations match
+        self._generation = 0
+        # The snapshot file this state was read from, and how much of the log has been applied
+        self._snapshot_id: Optional[Tuple[int, int]] = None
+        self._log_offset = 0
+
+    def _ensure_loaded(self):
+        # Called before taking _lock, which the loading thread holds until it is done
+        if self._loaded:
+            return
+        with self._save_lock, exclusive_file_lock(self.lock_path), self._lock:
+            if not self._loaded:
+                self._loaded = True
+                self._load()
+
+    def _file_id(self, path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load(self):
+        """Reads the snapshot and replays the log; needs the file lock."""
+        self._snapshot_id = self._file_id(self.path)
+        if self._snapshot_id is not None:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+            self._chunk_ids = state["chunk_ids"]
+            self._doc_lengths = array("I", state["doc_lengths"])
+            self._postings = {term: bytearray(data) for term, data in state["postings"].items()}
+            self._last_doc = state["last_doc"]
+            self._generation = state.get("generation", 0)
+            self._doc_freq = state.get("doc_freq") or {
+                term: sum(1 for _ in _decode_postings(data)) for term, data in self._postings.items()
+            }
+            self._doc_numbers = {chunk_id: n for n, chunk_id in enumerate(self._chunk_ids) if chunk_id is not None}
+            self._deleted = len(self._chunk_ids) - len(self._doc_numbers)
+            self._total_length = sum(
+                length for n, length in enumerate(self._doc_lengths) if self._chunk_ids[n] is not None
+            )
+        if not self._replay_log():
+            # Left over from before the last snapshot, which already contains it
+            self._start_log(self._generation)
+
+    def _replay_log(self) -> bool:
+        """Applies the logged changes past the part already applied; needs the file lock.
+
+        Returns False if the log belongs to another snapshot generation.
+        """
+        if not os.path.exists(self.log_path):
+            return True
+        with open(self.log_path, "rb") as f:
+            try:
+                _, generation = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                return False
+            if generation != self._generation:
+                return False
+            f.seek(max(f.tell(), self._log_offset))
+            while True:
+                offset = f.tell()
+                try:
+                    changes = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    break
+                for change in changes:
+                    self._apply(change)
+        # A save killed half-way leaves a partial record; later appends must not land behind it
+        if offset < os.path.getsize(self.log_path):
+            os.truncate(self.log_path, offset)
+        self._log_offset = offset
+        return True
+
+    def _start_log(self, generation: int):
+        tmp_path = f"{self.log_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(("generation", generation), f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._log_offset = f.tell()
+        os.replace(tmp_path, self.log_path)
+
+    def _catch_up(self):
+        """Applies changes saved by other processes, keeping this process's unsaved ones on top.
+
+        Needs the file lock and _lock.
+        """
+        if self._file_id(self.path) == self._snapshot_id:
+            log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+            if log_size <= self._log_offset:
+                return
+            if self._replay_log():
+                for change in self._pending:
+                    self._apply(change)
+                return
+        # Another process rewrote the snapshot
+        pending = self._pending
+        self._reset()
+        self._load()
+        for change in pending:
+            self._apply(change)
+        self._pending = pending
+
+    def refresh(self):
+        """Picks up changes other processes have saved since this one last read the files."""
+        self._ensure_loaded()
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if log_size == self._log_offset and self._file_id(self.path) == self._snapshot_id:
+            return
+        with self._save_lock, exclusive_file_lock(self.lock_path), self._lock:
+            self._catch_up()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._doc_numbers)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        self._ensure_loaded()
+        with self._lock:
+            return chunk_id in self._doc_numbers
+
+    def save(self):
+        """Appends the changes since the last save to the log, rewriting the snapshot once the log is large."""
+        self._ensure_loaded()
+        with self._save_lock, exclusive_file_lock(self.lock_path):
+            with self._lock:
+                self._catch_up()
+                changes, self._pending = self._pending, []
+            if not changes:
+                return
+            with open(self.log_path, "ab") as f:
+                if f.tell() == 0:
+                    pickle.dump(("generation", self._generation), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(changes, f, protocol=pickle.HIGHEST_PROTOCOL)
+                self._log_offset = f.tell()
+            snapshot_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if self._log_offset > self.log_ratio * max(snapshot_size, 1 << 20):
+                self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Atomically rewrites the snapshot and starts an empty log; needs the save lock and the file lock."""
+        with self._lock:
+            generation = self._generation + 1
+            state = {
+                "chunk_ids": list(self._chunk_ids),
+                "doc_lengths": self._doc_lengths.tobytes(),
+                "postings": {term: bytes(data) for term, data in self._postings.items()},
+                "last_doc": dict(self._last_doc),
+                "doc_freq": dict(self._doc_freq),
+                "generation": generation,
+            }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        # Changes made while the snapshot was taken are still pending and go to the new log
+        self._start_log(generation)
+        self._generation = generation
+        self._snapshot_id = self._file_id(self.path)
+
+    def add(self, chunk_id: str, text: str):
+        """Indexes a chunk, replacing any earlier version with the same id."""
+        change = ("add", chunk_id, dict(Counter(tokenize(text))))
+        self._ensure_loaded()
+        with self._lock:
+            self._apply(change)
+            self._pending.append(change)
+
+    def remove(self, chunk_id: str):
+        """Removes a chunk from search results."""
+        self._ensure_loaded()
+        with self._lock:
+            if chunk_id in self._doc_numbers:
+                change = ("remove", chunk_id)
+                self._apply(change)
+                self._pending.append(change)
+
+    def _apply(self, change: tuple):
+        if change[0] == "remove":
+            self._remove(change[1])
+            return
+        _, chunk_id, term_counts = change
+        if chunk_id in self._doc_numbers:
+            self._remove(chunk_id)
+        doc_number = len(self._chunk_ids)
+        self._chunk_ids.append(chunk_id)
+        self._doc_numbers[chunk_id] = doc_number
+        length = sum(term_counts.values())
+        self._doc_lengths.append(length)
+        self._total_length += length
+        for term, frequency in term_counts.items():
+            postings = self._postings.setdefault(term, bytearray())
+            _encode_varint(doc_number - self._last_doc.get(term, 0), postings)
+            _encode_varint(frequency, postings)
+            self._last_doc[term] = doc_number
+            self._doc_freq[term] = self._doc_freq.get(term, 0) + 1
+
+    def _remove(self, chunk_id: str):
+        doc_number = self._doc_numbers.pop(chunk_id, None)
+        if doc_number is None:
+            return
+        self._chunk_ids[doc_number] = None
+        self._total_length -= self._doc_lengths[doc_number]
+        self._deleted += 1
+        if self._deleted > self.compact_ratio * len(self._chunk_ids):
+            self._compact()
+
+    def compact(self):
+        """Rewrites postings without removed chunks and renumbers the remaining ones."""
+        self._ensure_loaded()
+        self._compact()
+
+    def _compact(self):
+        with self._lock:
+            renumbered = {}
+            chunk_ids, doc_lengths = [], array("I")
+            for old_number, chunk_id in enumerate(self._chunk_ids):
+                if chunk_id is not None:
+                    renumbered[old_number] = len(chunk_ids)
+                    chunk_ids.append(chunk_id)
+                    doc_lengths.append(self._doc_lengths[old_number])
+            postings, last_doc, doc_freq = {}, {}, {}
+            for term, data in self._postings.items():
+                new_postings = bytearray()
+                previous = count = 0
+                for old_number, frequency in _decode_postings(data):
+                    new_number = renumbered.get(old_number)
+                    if new_number is None:
+                        continue
+                    _encode_varint(new_number - previous, new_postings)
+                    _encode_varint(frequency, new_postings)
+                    previous = new_number
+                    count += 1
+                if new_postings:
+                    postings[term] = new_postings
+                    last_doc[term] = previous
+                    doc_freq[term] = count
+            self._chunk_ids = chunk_ids
+            self._doc_lengths = doc_lengths
+            self._doc_numbers = {chunk_id: n for n, chunk_id in enumerate(chunk_ids)}
+            self._postings = postings
+            self._last_doc = last_doc
+            self._doc_freq = doc_freq
+            self._deleted = 0
+
+    def search(
+        self, query: str, top_k: int = 10, allow: Optional[Callable[[str], bool]] = None
+    ) -> List[Tuple[str, float]]:
+        """Returns up to top_k (chunk id, BM25 score) pairs, best first."""
+        self.refresh()
+        with self._lock:
+            live_docs = len(self._doc_numbers)
+            if not live_docs:
+                return []
+            average_length = self._total_length / live_docs or 1.0
+            scores: Dict[int, float] = {}
+            terms = [term for term in set(tokenize(query)) if term in self._postings]
+            # Terms found in most chunks barely change the ranking but are the most expensive to decode
+            max_doc_freq = self.max_df_ratio * len(self._chunk_ids)
+            rare_terms = [term for term in terms if self._doc_freq.get(term, 0) <= max_doc_freq]
+            for term in rare_terms or terms:
+                data = self._postings[term]
+                postings = [
+                    (n, tf) for n, tf in _decode_postings(data) if self._chunk_ids[n] is not None
+                ]
+                if not postings:
+                    continue
+                idf = math.log(1 + (live_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_number, frequency in postings:
+                    length_norm = 1 - self.b + self.b * self._doc_lengths[doc_number] / average_length
+                    scores[doc_number] = scores.get(doc_number, 0.0) + idf * (
+                        frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                    )
+            candidates = (
+                (self._chunk_ids[n], score)
+                for n, score in scores.items()
+                if allow is None or allow(self._chunk_ids[n])
+            )
+            return nlargest(top_k, candidates, key=lambda item: item[1])
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuses several ranked id lists into one, scoring each id by the sum of 1 / (k + rank)."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -1,25 +1,126 @@
 # chat.py
 
+import logging
+from typing import TYPE_CHECKING, Iterator, List
+
 import streamlit as st
-import sys
-import ollama
-from langchain.schema import AIMessage, HumanMessage
-from langchain_ollama import ChatOllama
+
+from config import load_config
+from context_packer import estimate_tokens
+
+# langchain is imported by the functions that need it
+if TYPE_CHECKING:
+    from langchain.schema import BaseMessage
+    from langchain_ollama import ChatOllama
+
+config = load_config()
+
+# Sent first with every request and never changed, so Ollama can reuse the work for this prefix
+CHAT_SYSTEM_PROMPT = "You are a helpful assistant. Answer clearly and concisely."
+
+SUMMARY_PROMPT = (
+    "Condense the conversation below into a short summary that keeps every fact, "
+    "name, number and decision needed to continue it. Reply with the summary only."
+)
+
+@st.cache_resource(show_spinner=False)
+def get_chat_client(model: str) -> "ChatOllama":
+    """Returns the shared chat client for a model, created once per process."""
+    from langchain_ollama import ChatOllama
+
+    return ChatOllama(
+        model=model,
+        temperature=0.7,
+        # Keeps the model loaded between messages instead of reloading it after Ollama's idle timeout
+        keep_alive=config.get("chat_keep_alive", "30m"),
+    )
+
+class ChatSession:
+    """Conversation history kept within a token budget.
+
+    When the history grows past history_token_budget, the oldest messages are
+    folded into a running summary, leaving about half the budget for recent turns.
+    """
+
+    def __init__(self, history_token_budget: int = 3000):
+        self.history_token_budget = history_token_budget
+        self.summary = ""
+        self.messages: List["BaseMessage"] = []
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(estimate_tokens(m.content) for m in self.messages)
+
+    def build_messages(self, prompt: str) -> List["BaseMessage"]:
+        """Returns the request: the fixed system prompt, the summary, the recent turns and the new prompt."""
+        from langchain.schema import HumanMessage, SystemMessage
+
+        messages = [SystemMessage(content=CHAT_SYSTEM_PROMPT)]
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"))
+        return messages + self.messages + [HumanMessage(content=prompt)]
+
+    def stream_reply(self, llm: "ChatOllama", prompt: str) -> Iterator[str]:
+        """Streams the reply to prompt and records both in the history once it is complete."""
+        from langchain.schema import AIMessage, HumanMessage
+
+        reply = ""
+        for chunk in llm.stream(self.build_messages(prompt)):
+            reply += chunk.content
+            yield chunk.content
+        self.messages += [HumanMessage(content=prompt), AIMessage(content=reply)]
+
+    def compact(self, llm: "ChatOllama"):
+        """Summarizes the oldest messages once the history exceeds its token budget."""
+        from langchain.schema import HumanMessage, SystemMessage
+
+        if self.history_tokens() <= self.history_token_budget:
+            return
+        keep_tokens = self.history_token_budget // 2
+        # Keep whole user/assistant pairs, newest first, within half the budget
+        kept = len(self.messages)
+        used = 0
+        while kept >= 2:
+            pair_tokens = sum(estimate_tokens(m.content) for m in self.messages[kept - 2:kept])
+            if used + pair_tokens > keep_tokens:
+                break
+            used += pair_tokens
+            kept -= 2
+        old, recent = self.messages[:kept], self.messages[kept:]
+        if not old:
+            return
+        transcript = "\n".join(
+            f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}" for m in old
+        )
+        if self.summary:
+            transcript = f"Earlier summary: {self.summary}\n{transcript}"
+        try:
+            response = llm.invoke([SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=transcript)])
+            self.summary = response.content.strip()
+            self.messages = recent
+        except Exception as e:
+            # Keep the full history; the next message will try again
+            logging.error(f"An error occurred while summarizing the chat history: {e}")
 
 def chat_interface():
+    from langchain.schema import AIMessage, HumanMessage
+
     st.header("Chat with the Assistant")
 
-    # Initialize chat history
-    if "chat_history" not in st.session_state:
-        st.session_state["chat_history"] = []
+    # Initialize chat session
+    if "chat_session" not in st.session_state:
+        st.session_state["chat_session"] = ChatSession(config.get("chat_history_token_budget", 3000))
+    session: ChatSession = st.session_state["chat_session"]
 
     # Select LLM model
     models = get_models()
     selected_model = st.selectbox("Select LLM:", models, key="selected_chat_model")
-    st.session_state["selected_chat_model"] = selected_model
+    if not selected_model:
+        return
 
     # Display chat history
-    for message in st.session_state["chat_history"]:
+    if session.summary:
+        st.caption("Earlier messages have been summarized to keep responses fast.")
+    for message in session.messages:
         if isinstance(message, HumanMessage):
             st.chat_message("user").write(message.content)
         elif isinstance(message, AIMessage):
@@ -30,22 +131,26 @@ def chat_interface():
     if prompt:
         # Display user message
         st.chat_message("user").write(prompt)
-        st.session_state["chat_history"].append(HumanMessage(content=prompt))
 
-        # Get response from LLM
-        with st.spinner("Assistant is typing..."):
-            llm = ChatOllama(model=selected_model, temperature=0.7)
-            response = ""
-            for chunk in llm.stream(prompt):
-                response += chunk
+        # Stream the response from the LLM
+        llm = get_chat_client(selected_model)
+        try:
+            with st.chat_message("assistant"):
+                st.write_stream(session.stream_reply(llm, prompt))
+        except Exception as e:
+            logging.error(f"An error occurred while generating the chat response: {e}")
+            st.error(f"An error occurred while generating the chat response: {e}")
+            return
+
+        session.compact(llm)
 
-        # Display assistant message
-        st.chat_message("assistant").write(response)
-        st.session_state["chat_history"].append(AIMessage(content=response))
+@st.cache_data(ttl=config.get("chat_models_ttl", 60), show_spinner=False)
+def get_models() -> List[str]:
+    """Lists the locally available Ollama models, refreshed at most once per TTL."""
+    import ollama
 
-def get_models():
     models = ollama.list()
     if not models:
         st.error("No models found. Please visit https://ollama.dev/models to download models.")
         return []
-    return [model["name"] for model in models["models"]]
\ No newline at end of file
+    return [model["name"] for model in models["models"]]
@@ -0,0 +1,13 @@
+# config.py
+
+from functools import lru_cache
+
+import yaml
+
+CONFIG_PATH = "config.yaml"
+
+@lru_cache(maxsize=None)
+def load_config() -> dict:
+    """Loads config.yaml once per process; every module shares the returned dict."""
+    with open(CONFIG_PATH, "r") as f:
+        return yaml.safe_load(f)
@@ -0,0 +1,114 @@
+# context_packer.py
+
+import re
+from typing import Dict, List, Set, Tuple
+
+from tracing import traced
+
+# Rough average for English text with Llama-style tokenizers
+CHARS_PER_TOKEN = 4
+
+_WORD = re.compile(r"\w+")
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of model tokens in text without loading a tokenizer."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _join_overlapping(first: str, second: str, max_overlap: int, min_overlap: int = 16) -> str:
+    """Joins two consecutive chunks, dropping the text the splitter repeated at the start of the second."""
+    longest = min(len(first), len(second), max_overlap)
+    for size in range(longest, min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + " " + second
+
+def _shingles(text: str, size: int = 5) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _truncate_to_tokens(text: str, token_budget: int) -> str:
+    limit = token_budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit]
+
+@traced("pack_context")
+def pack_context(
+    documents: List[str],
+    metadatas: List[dict],
+    ranked_indices: List[int],
+    scores: List[float],
+    token_budget: int = 1500,
+    max_overlap: int = 200,
+    duplicate_threshold: float = 0.8,
+) -> Tuple[str, List[int]]:
+    """Builds the LLM context from re-ranked chunks within a token budget.
+
+    Consecutive chunks of the same file (by their "chunk" metadata) are merged into
+    one passage without the repeated overlap, passages that mostly repeat a better
+    one are dropped, and the best passages are added until the budget is used up.
+    ranked_indices and scores are the re-ranker's selection, best first.
+    Returns the context and the indices of the chunks it contains, best first.
+    """
+    score_of = dict(zip(ranked_indices, scores))
+
+    # Group the selected chunks into runs of consecutive chunk numbers per file
+    by_file: Dict[str, List[Tuple[int, int]]] = {}
+    passages: List[Tuple[float, List[int]]] = []
+    for idx in ranked_indices:
+        metadata = metadatas[idx] or {}
+        chunk_number = metadata.get("chunk")
+        if isinstance(chunk_number, int) and metadata.get("file_name"):
+            by_file.setdefault(metadata["file_name"], []).append((chunk_number, idx))
+        else:
+            passages.append((score_of[idx], [idx]))
+    for chunks in by_file.values():
+        chunks.sort()
+        run = [chunks[0]]
+        for chunk in chunks[1:]:
+            if chunk[0] - run[-1][0] <= 1:
+                run.append(chunk)
+            else:
+                passages.append((max(score_of[i] for _, i in run), [i for _, i in run]))
+                run = [chunk]
+        passages.append((max(score_of[i] for _, i in run), [i for _, i in run]))
+
+    texts: List[str] = []
+    for _, members in passages:
+        text = documents[members[0]]
+        for previous, current in zip(members, members[1:]):
+            if documents[current] == documents[previous]:
+                continue
+            text = _join_overlapping(text, documents[current], max_overlap)
+        texts.append(text)
+
+    order = sorted(range(len(passages)), key=lambda p: passages[p][0], reverse=True)
+    selected_texts: List[str] = []
+    selected_shingles: List[Set[Tuple[str, ...]]] = []
+    selected_indices: List[int] = []
+    used_tokens = 0
+    for p in order:
+        text = texts[p]
+        shingles = _shingles(text)
+        # Skip passages whose content is mostly covered by a better one already chosen
+        if any(
+            len(shingles & other) / max(1, min(len(shingles), len(other))) >= duplicate_threshold
+            for other in selected_shingles
+        ):
+            continue
+        tokens = estimate_tokens(text)
+        if used_tokens + tokens > token_budget:
+            if selected_texts:
+                continue
+            # The best passage alone is over budget: keep as much of it as fits
+            text = _truncate_to_tokens(text, token_budget)
+            tokens = estimate_tokens(text)
+        selected_texts.append(text)
+        selected_shingles.append(shingles)
+        selected_indices.extend(sorted(passages[p][1], key=lambda i: -score_of[i]))
+        used_tokens += tokens
+
+    return "\n\n".join(selected_texts), selected_indices
@@ -1,87 +1,210 @@
 # document_processing.py
 
+import codecs
+import io
 import os
 import logging
-from typing import List
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 import hashlib
 
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import streamlit as st
-import yaml
 
-from PyPDF2 import PdfReader
-from docx import Document as DocxDocument
-from bs4 import BeautifulSoup
+from config import load_config
+from tracing import span, timed_iter
+from vector_store import manifest
 
-def load_config():
-    with open("config.yaml", "r") as f:
-        return yaml.safe_load(f)
+# langchain and the file format parsers are imported by the functions that need them
+if TYPE_CHECKING:
+    from langchain.schema import Document
 
 config = load_config()
 
-def is_document_already_processed(file_name: str) -> bool:
-    """Checks if the document has already been processed."""
-    # Implement your logic here, possibly by checking a database or a processed files list
-    return False
+def is_document_already_processed(file_name: str, file_hash: str) -> bool:
+    """Checks if the document has already been processed with identical content."""
+    return manifest.get_file_hash(file_name) == file_hash
 
-def process_document(file, chunk_size: int = 1000, chunk_overlap: int = 100) -> List[Document]:
+def process_document(file, chunk_size: int = 1000, chunk_overlap: int = 100) -> List["Document"]:
     """Processes an uploaded document, extracting text and splitting it into chunks."""
     try:
-        file_extension = os.path.splitext(file.name)[1].lower()
-        if file_extension == ".pdf":
-            text = extract_text_from_pdf(file)
-        elif file_extension == ".docx":
-            text = extract_text_from_docx(file)
-        elif file_extension == ".txt":
-            text = extract_text_from_txt(file)
-        elif file_extension == ".html":
-            text = extract_text_from_html(file)
-        else:
-            st.error(f"Unsupported file type: {file_extension}")
-            return []
-
-        # Split the text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap
-        )
-        splits = text_splitter.split_text(text)
-        # Create Document objects with metadata
-        docs = []
-        for idx, split in enumerate(splits):
-            metadata = {
-                "file_name": file.name,
-                "chunk": idx,
-            }
-            doc = Document(page_content=split, metadata=metadata)
-            docs.append(doc)
-        return docs
+        return list(iter_document_splits(file, chunk_size, chunk_overlap))
     except Exception as e:
         logging.error(f"An error occurred while processing the document: {e}")
         st.error(f"An error occurred while processing the document: {e}")
         return []
 
-def extract_text_from_pdf(file) -> str:
-    """Extracts text from a PDF file."""
+def iter_document_splits(file, chunk_size: int = 1000, chunk_overlap: int = 100) -> Iterator["Document"]:
+    """Streams an uploaded document as chunks, splitting text while it is still being extracted.
+
+    Extraction errors are raised to the consumer, so a document that fails part-way
+    is never taken for a complete one.
+    """
+    from langchain.schema import Document
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    file_type = os.path.splitext(file.name)[1].lower().lstrip(".")
+    units = _iter_text_units(file)
+    if units is None:
+        st.error(f"Unsupported file type: {os.path.splitext(file.name)[1].lower()}")
+        return
+    units = timed_iter(units, "extract")
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+    )
+    # Text is split whenever the buffer holds this many characters, which bounds memory use
+    flush_size = chunk_size * config.get("split_buffer_chunks", 16)
+    buffer_parts, buffer_len = [], 0
+    # Offsets in the buffer where each page starts, for page metadata
+    page_starts, page_numbers = [], []
+    chunk_index = 0
+
+    def make_document(split: "Document") -> "Document":
+        metadata = {
+            "file_name": file.name,
+            "file_type": file_type,
+            "chunk": chunk_index,
+        }
+        if page_starts:
+            position = bisect_right(page_starts, split.metadata["start_index"]) - 1
+            metadata["page"] = page_numbers[max(position, 0)]
+        return Document(page_content=split.page_content, metadata=metadata)
+
+    for page, unit_text in units:
+        if page is not None:
+            page_starts.append(buffer_len)
+            page_numbers.append(page)
+        buffer_parts.append(unit_text)
+        buffer_len += len(unit_text)
+        if buffer_len < flush_size:
+            continue
+
+        buffer = "".join(buffer_parts)
+        with span("split", characters=len(buffer)):
+            splits = text_splitter.create_documents([buffer])
+        for split in splits[:-1]:
+            yield make_document(split)
+            chunk_index += 1
+
+        # The last chunk may continue in the next unit, so it is carried over and split again
+        tail_start = splits[-1].metadata["start_index"] if splits else buffer_len
+        buffer_parts = [buffer[tail_start:]]
+        buffer_len = len(buffer_parts[0])
+        if page_starts:
+            first_kept = max(bisect_right(page_starts, tail_start) - 1, 0)
+            page_numbers = page_numbers[first_kept:]
+            page_starts = [0] + [start - tail_start for start in page_starts[first_kept + 1:]]
+
+    buffer = "".join(buffer_parts)
+    with span("split", characters=len(buffer)):
+        splits = text_splitter.create_documents([buffer])
+    for split in splits:
+        yield make_document(split)
+        chunk_index += 1
+
+def _iter_text_units(file) -> Optional[Iterator[Tuple[Optional[int], str]]]:
+    """Returns an iterator of (page number, text) pieces for a supported file, or None."""
+    file_extension = os.path.splitext(file.name)[1].lower()
+    if file_extension == ".pdf":
+        return ((page, text + "\n") for page, text in iter_pages_from_pdf(file))
+    elif file_extension == ".docx":
+        return ((None, text) for text in iter_text_from_docx(file))
+    elif file_extension == ".txt":
+        return ((None, text) for text in iter_text_from_txt(file))
+    elif file_extension == ".html":
+        return ((None, text) for text in iter_text_from_html(file))
+    return None
+
+_worker_pdf_reader = None
+
+def _init_pdf_worker(data: bytes):
+    from PyPDF2 import PdfReader
+
+    global _worker_pdf_reader
+    _worker_pdf_reader = PdfReader(io.BytesIO(data))
+
+def _extract_pdf_page_range(page_range: Tuple[int, int]) -> List[Tuple[int, str]]:
+    start, end = page_range
+    return [
+        (page_number + 1, _worker_pdf_reader.pages[page_number].extract_text() or "")
+        for page_number in range(start, end)
+    ]
+
+def iter_pages_from_pdf(file) -> Iterator[Tuple[int, str]]:
+    """Yields (page number, text) pairs from a PDF, spreading large files over a process pool."""
+    from PyPDF2 import PdfReader
+
+    data = file.read()
+    reader = PdfReader(io.BytesIO(data))
+    num_pages = len(reader.pages)
+    workers = min(config.get("pdf_workers", os.cpu_count() or 1), num_pages)
+    if workers <= 1 or num_pages < config.get("pdf_parallel_min_pages", 50):
+        for page_number, page in enumerate(reader.pages):
+            yield page_number + 1, page.extract_text() or ""
+        return
+
+    # Several ranges per worker keeps the pool busy when some pages are much heavier
+    range_size = max(1, num_pages // (workers * 4))
+    page_ranges = [
+        (start, min(start + range_size, num_pages))
+        for start in range(0, num_pages, range_size)
+    ]
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_pdf_worker, initargs=(data,)
+    ) as pool:
+        # Only a few ranges are in flight at once so extracted text does not pile up
+        pending = deque()
+        for page_range in page_ranges:
+            pending.append(pool.submit(_extract_pdf_page_range, page_range))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def iter_text_from_docx(file) -> Iterator[str]:
+    """Yields the paragraphs of a Word (.docx) file."""
+    from docx import Document as DocxDocument
+
+    doc = DocxDocument(file)
+    for paragraph in doc.paragraphs:
+        yield paragraph.text + "\n"
+
+def iter_text_from_txt(file, block_size: int = 1 << 20) -> Iterator[str]:
+    """Yields a UTF-8 text file in decoded blocks."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for block in iter(lambda: file.read(block_size), b""):
+        yield decoder.decode(block)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def iter_text_from_html(file) -> Iterator[str]:
+    """Yields the text nodes of an HTML file."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(file.read().decode('utf-8'), 'html.parser')
+    for string in soup.strings:
+        yield string + "\n"
+
+def extract_pages_from_pdf(file) -> List[Tuple[int, str]]:
+    """Extracts (page number, text) pairs from a PDF file."""
     try:
-        reader = PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-        return text
+        return list(iter_pages_from_pdf(file))
     except Exception as e:
         logging.error(f"An error occurred while extracting text from PDF: {e}")
         st.error(f"An error occurred while extracting text from PDF: {e}")
-        return ""
+        return []
+
+def extract_text_from_pdf(file) -> str:
+    """Extracts text from a PDF file."""
+    return "\n".join(text for _, text in extract_pages_from_pdf(file))
 
 def extract_text_from_docx(file) -> str:
     """Extracts text from a Word (.docx) file."""
     try:
-        doc = DocxDocument(file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
+        return "".join(iter_text_from_docx(file))
     except Exception as e:
         logging.error(f"An error occurred while extracting text from DOCX: {e}")
         st.error(f"An error occurred while extracting text from DOCX: {e}")
@@ -90,8 +213,7 @@ def extract_text_from_docx(file) -> str:
 def extract_text_from_txt(file) -> str:
     """Extracts text from a text (.txt) file."""
     try:
-        text = file.read().decode('utf-8')
-        return text
+        return "".join(iter_text_from_txt(file))
     except Exception as e:
         logging.error(f"An error occurred while extracting text from TXT: {e}")
         st.error(f"An error occurred while extracting text from TXT: {e}")
@@ -100,10 +222,7 @@ def extract_text_from_txt(file) -> str:
 def extract_text_from_html(file) -> str:
     """Extracts text from an HTML file."""
     try:
-        content = file.read().decode('utf-8')
-        soup = BeautifulSoup(content, 'html.parser')
-        text = soup.get_text(separator="\n")
-        return text
+        return "".join(iter_text_from_html(file))
     except Exception as e:
         logging.error(f"An error occurred while extracting text from HTML: {e}")
         st.error(f"An error occurred while extracting text from HTML: {e}")
@@ -0,0 +1,167 @@
+# embeddings.py
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from chromadb import Documents, EmbeddingFunction, Embeddings
+except ImportError:
+    # chromadb is only needed for the Chroma vector backend
+    Documents = List[str]
+    Embeddings = List[List[float]]
+    EmbeddingFunction = object
+
+from embedding_cache import EmbeddingCache
+from ingestion_manifest import text_hash
+
+class OllamaEmbedder(EmbeddingFunction):
+    """Embedding function for Chroma that talks to Ollama over a pooled HTTP session.
+
+    Texts are sent in batches of ``batch_size`` with at most ``max_in_flight``
+    requests running concurrently. Failed batches are retried with backoff.
+    When a cache is given, only texts it has not seen for this model are sent.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        model_name: str,
+        pool_size: int = 10,
+        timeout: float = 60.0,
+        batch_size: int = 32,
+        max_in_flight: int = 4,
+        max_retries: int = 3,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.url = url
+        self.model_name = model_name
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.cache = cache
+        self._pool_size = max(pool_size, max_in_flight)
+        self._lock = threading.Lock()
+        self._session = self._new_session()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="ollama-embed")
+        # Older Ollama servers only offer the single-prompt endpoint
+        self._batch_api = True
+        self.total_chunks = 0
+        self.total_seconds = 0.0
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    @property
+    def base_url(self) -> str:
+        """Returns the Ollama server root, e.g. http://localhost:11434."""
+        return self.url.split("/api/", 1)[0]
+
+    @property
+    def throughput(self) -> float:
+        """Returns the average embedding throughput in chunks/sec since startup."""
+        return self.total_chunks / self.total_seconds if self.total_seconds else 0.0
+
+    def reconnect(self):
+        """Drops all pooled connections and opens a fresh session."""
+        with self._lock:
+            old_session = self._session
+            self._session = self._new_session()
+        old_session.close()
+
+    def ping(self) -> bool:
+        """Checks that the Ollama server is reachable."""
+        try:
+            response = self._session.get(f"{self.base_url}/api/version", timeout=5)
+            return response.ok
+        except requests.RequestException as e:
+            logging.warning(f"Ollama health check failed: {e}")
+            return False
+
+    def _embed_one(self, text: str) -> List[float]:
+        response = self._session.post(
+            self.url,
+            json={"model": self.model_name, "prompt": text},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return response.json()["embedding"]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self._batch_api:
+            response = self._session.post(
+                f"{self.base_url}/api/embed",
+                json={"model": self.model_name, "input": texts},
+                timeout=self.timeout,
+            )
+            # A model that has not been pulled is also a 404, but with a JSON error body;
+            # only the router's plain-text reply means the endpoint itself is missing
+            if response.status_code != 404 or "page not found" not in response.text:
+                response.raise_for_status()
+                return response.json()["embeddings"]
+            logging.info("Ollama has no batch embedding endpoint, falling back to single prompts.")
+            self._batch_api = False
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_batch_with_retry(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._embed_batch(texts)
+            except requests.RequestException as e:
+                status = e.response.status_code if e.response is not None else None
+                # Client errors (e.g. an unknown model) fail the same way on every attempt
+                if attempt == self.max_retries or (status is not None and 400 <= status < 500 and status not in (408, 429)):
+                    raise
+                logging.warning(f"Embedding batch failed (attempt {attempt + 1}), retrying: {e}")
+                if isinstance(e, requests.ConnectionError):
+                    # Stale pooled connections (e.g. after an Ollama restart)
+                    self.reconnect()
+                time.sleep(min(2 ** attempt * 0.5, 10))
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_texts(texts)
+
+        hashes = [text_hash(text) for text in texts]
+        embeddings = self.cache.get_many(self.model_name, hashes)
+        missing = {}
+        for hash_, text in zip(hashes, texts):
+            if hash_ not in embeddings:
+                missing.setdefault(hash_, text)
+        if missing:
+            fresh = dict(zip(missing, self._embed_texts(list(missing.values()))))
+            self.cache.put_many(self.model_name, fresh)
+            embeddings.update(fresh)
+        return [embeddings[hash_] for hash_ in hashes]
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            results = [self._embed_batch_with_retry(batches[0])]
+        else:
+            results = list(self._executor.map(self._embed_batch_with_retry, batches))
+        embeddings = [embedding for batch in results for embedding in batch]
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.total_chunks += len(texts)
+            self.total_seconds += elapsed
+        if len(texts) > 1:
+            logging.info(
+                f"Embedded {len(texts)} chunks in {elapsed:.2f}s "
+                f"({len(texts) / elapsed:.1f} chunks/sec, average {self.throughput:.1f})"
+            )
+        return embeddings
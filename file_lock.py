@@ -0,0 +1,29 @@
+# file_lock.py
+
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory locks on this platform; processes sharing a store then rely on not writing at the same time
+    fcntl = None
+
+@contextmanager
+def exclusive_file_lock(path: str) -> Iterator[None]:
+    """Holds an exclusive advisory lock on path, created if needed, for the duration of the block.
+
+    Every call opens the file anew, so the lock also excludes other threads of the
+    same process; callers keep it only around a read-modify-write of shared files.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,44 @@
+# ingest_checkpoint.py
+
+import json
+import os
+import threading
+from typing import Dict, Tuple
+
+class Checkpoint:
+    """Append-only JSON lines record of finished files, keyed by path, size and modification time."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A run killed while writing leaves a partial last line
+                        continue
+                    self.entries[entry["path"]] = entry
+
+    @staticmethod
+    def _signature(path: str) -> Tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def is_done(self, path: str) -> bool:
+        entry = self.entries.get(path)
+        if not entry or entry["status"] == "failed":
+            return False
+        return (entry["size"], entry["mtime_ns"]) == self._signature(path)
+
+    def record(self, path: str, status: str, chunks: int = 0):
+        size, mtime_ns = self._signature(path)
+        entry = {"path": path, "status": status, "chunks": chunks, "size": size, "mtime_ns": mtime_ns}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[path] = entry
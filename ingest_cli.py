@@ -0,0 +1,153 @@
+# ingest_cli.py
+"""Bulk ingestion of a directory tree from the command line.
+
+    python ingest_cli.py /data/corpus --workers 8
+    python ingest_cli.py /data/corpus /data/more --extensions pdf txt --restart
+
+Files go through the same extractors and vector store code as uploads in the
+app. Every finished file is appended to a checkpoint file, so a killed run
+picks up where it stopped: files that are already done are skipped without
+being read, and chunks of a half-ingested file that are already stored are
+not embedded again. Documents are named by their path relative to the
+directory given, which keeps equally named files in different folders apart.
+
+It can run while the app or the service is up. The files the processes
+share (the BM25 index and, with the numpy backend, the row allocation) are
+locked only while one of them is updated, and each process first takes over
+what the others wrote.
+"""
+
+import argparse
+import io
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Tuple
+
+from config import load_config
+from document_processing import is_document_already_processed, iter_document_splits
+from ingest_checkpoint import Checkpoint
+from ingestion_manifest import file_content_hash
+from tracing import start_trace
+from vector_store import add_to_vector_collection
+
+config = load_config()
+
+SUPPORTED_EXTENSIONS = ("pdf", "docx", "txt", "html")
+
+def iter_files(roots: List[str], extensions: List[str]) -> Iterator[Tuple[str, str]]:
+    """Yields (path, document name) for every supported file under the roots, in a stable order."""
+    suffixes = tuple(f".{extension.lower().lstrip('.')}" for extension in extensions)
+    for root in roots:
+        # Absolute paths keep checkpoint entries valid when the command is run from another directory
+        root = os.path.abspath(root)
+        if os.path.isfile(root):
+            yield root, os.path.basename(root)
+            continue
+        for directory, subdirectories, files in os.walk(root):
+            subdirectories.sort()
+            for name in sorted(files):
+                if name.lower().endswith(suffixes):
+                    path = os.path.join(directory, name)
+                    yield path, os.path.relpath(path, root).replace(os.sep, "/")
+
+def ingest_file(path: str, name: str, embed_slot: threading.Semaphore) -> Tuple[str, int, dict]:
+    """Ingests one file; returns its status, chunk count and stage breakdown."""
+    # FileIO lets the file carry the document name, which the extractors and chunk metadata use
+    file = io.FileIO(path, "rb")
+    file.name = name
+    chunks = [0]
+
+    def on_progress(count: int):
+        chunks[0] = count
+
+    with file:
+        file_hash = file_content_hash(file)
+        if is_document_already_processed(name, file_hash):
+            return "unchanged", 0, {}
+        with start_trace("ingest", file_name=name) as trace:
+            stored = add_to_vector_collection(
+                iter_document_splits(file, chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"]),
+                name,
+                file_hash,
+                embed_slot=embed_slot,
+                on_progress=on_progress,
+            )
+    stages = {stage["stage"]: stage for stage in trace.breakdown()}
+    return ("ingested" if stored else "failed"), chunks[0], stages
+
+def print_report(documents: int, chunks: int, failed: int, elapsed: float, stages: Dict[str, List[float]]):
+    print(f"Ingested {documents} documents ({chunks} chunks) in {elapsed:.1f} s, {failed} failed")
+    if elapsed > 0:
+        print(f"  {documents / elapsed:.2f} docs/sec, {chunks / elapsed:.1f} chunks/sec")
+    if not stages:
+        return
+    # Stage times are summed over all workers, so with several workers they add up to more than the wall time
+    total = sum(seconds for _, seconds in stages.values()) or 1.0
+    print(f"  {'stage':<24}{'calls':>10}{'total s':>12}{'share':>8}")
+    for name, (calls, seconds) in sorted(stages.items(), key=lambda item: item[1][1], reverse=True):
+        print(f"  {name:<24}{int(calls):>10}{seconds:>12.2f}{seconds / total:>8.0%}")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="directories (walked recursively) or single files")
+    parser.add_argument("--workers", type=int, default=config.get("ingest_workers", 2), help="files ingested at once")
+    parser.add_argument(
+        "--embed-concurrency",
+        type=int,
+        default=config.get("ingest_embed_concurrency", 1),
+        help="workers allowed to embed at the same time",
+    )
+    parser.add_argument("--extensions", nargs="+", default=list(SUPPORTED_EXTENSIONS), choices=SUPPORTED_EXTENSIONS)
+    parser.add_argument(
+        "--checkpoint",
+        default=os.path.join(config["vector_store_path"], "ingest_checkpoint.jsonl"),
+        help="file recording finished files",
+    )
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and check every file again")
+    parser.add_argument("--log-traces", action="store_true", help="log the JSON trace of every file")
+    args = parser.parse_args()
+
+    if not args.log_traces:
+        logging.getLogger("tracing").setLevel(logging.WARNING)
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = Checkpoint(args.checkpoint)
+    files = list(iter_files(args.paths, args.extensions))
+    pending = [(path, name) for path, name in files if not checkpoint.is_done(path)]
+    print(f"Found {len(files)} files, {len(files) - len(pending)} already done", file=sys.stderr)
+
+    embed_slot = threading.BoundedSemaphore(args.embed_concurrency)
+    documents = chunks = failed = 0
+    stages: Dict[str, List[float]] = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="ingest") as executor:
+        futures = {executor.submit(ingest_file, path, name, embed_slot): path for path, name in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            try:
+                status, file_chunks, file_stages = future.result()
+            except Exception as e:
+                logging.error(f"An error occurred while ingesting '{path}': {e}")
+                status, file_chunks, file_stages = "failed", 0, {}
+            checkpoint.record(path, status, file_chunks)
+            if status == "failed":
+                failed += 1
+            elif status == "ingested":
+                documents += 1
+                chunks += file_chunks
+            for name, stage in file_stages.items():
+                totals = stages.setdefault(name, [0, 0.0])
+                totals[0] += stage["calls"]
+                totals[1] += stage["total_ms"] / 1000
+            print(f"[{done}/{len(pending)}] {status:<9} {path} ({file_chunks} chunks)", file=sys.stderr)
+
+    print_report(documents, chunks, failed, time.perf_counter() - start, stages)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
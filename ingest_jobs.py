@@ -0,0 +1,272 @@
+# ingest_jobs.py
+
+import io
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from config import load_config
+from document_processing import is_document_already_processed, iter_document_splits
+from tracing import start_trace
+from vector_store import add_to_vector_collection
+
+config = load_config()
+
+T = TypeVar("T")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+class IngestJobStore:
+    """Persistent list of ingestion jobs, one per uploaded file.
+
+    Uploads are copied next to the database, so a job survives a browser
+    refresh or a restart of the app until a worker has finished it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.upload_dir = os.path.join(os.path.dirname(path) or ".", "ingest_uploads")
+        self._lock = threading.Lock()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_name TEXT NOT NULL,
+                    file_hash TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    chunks_done INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    trace TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            # Job tables created before traces were kept
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "trace" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN trace TEXT")
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def enqueue(self, file, file_name: str, file_hash: str) -> Optional[int]:
+        """Copies an uploaded file to disk and queues it; returns None if it is already waiting."""
+        with self._connect() as conn:
+            pending = conn.execute(
+                "SELECT job_id FROM jobs WHERE file_name = ? AND file_hash = ? AND status IN (?, ?)",
+                (file_name, file_hash, QUEUED, RUNNING),
+            ).fetchone()
+        if pending:
+            return None
+        file_path = os.path.join(self.upload_dir, f"{file_hash[:16]}_{os.path.basename(file_name)}")
+        file.seek(0)
+        with open(file_path, "wb") as f:
+            shutil.copyfileobj(file, f)
+        file.seek(0)
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (file_name, file_hash, file_path, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file_name, file_hash, file_path, QUEUED, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self) -> Optional[Dict]:
+        """Marks the oldest queued job as running and returns it.
+
+        Jobs for a file that is already being ingested wait, so two versions of
+        one document are never written at the same time.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND file_name NOT IN "
+                "(SELECT file_name FROM jobs WHERE status = ?) ORDER BY job_id LIMIT 1",
+                (QUEUED, RUNNING),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?",
+                (RUNNING, time.time(), row["job_id"]),
+            )
+        return dict(row)
+
+    def set_progress(self, job_id: int, chunks_done: int):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET chunks_done = ?, updated_at = ? WHERE job_id = ?",
+                (chunks_done, time.time(), job_id),
+            )
+
+    def finish(self, job_id: int, status: str, error: Optional[str] = None, trace: Optional[dict] = None):
+        """Records the outcome of a job, with the timing breakdown of its ingest trace if there was one."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, trace = ?, updated_at = ? WHERE job_id = ?",
+                (status, error, json.dumps(trace, default=str) if trace else None, time.time(), job_id),
+            )
+            row = conn.execute("SELECT file_path FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        # Failed jobs keep their upload so they can be retried
+        if status == DONE and row and os.path.exists(row["file_path"]):
+            os.remove(row["file_path"])
+
+    def requeue_interrupted(self) -> int:
+        """Queues jobs left running by a previous process again; returns how many."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?", (QUEUED, time.time(), RUNNING)
+            ).rowcount
+
+    def retry_failed(self) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE status = ?",
+                (QUEUED, time.time(), FAILED),
+            ).rowcount
+
+    def clear_finished(self):
+        """Forgets finished and failed jobs and deletes the uploads they kept."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT file_path FROM jobs WHERE status IN (?, ?)", (DONE, FAILED)
+            ).fetchall()
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?)", (DONE, FAILED))
+            waiting = {row[0] for row in conn.execute("SELECT file_path FROM jobs")}
+        for row in rows:
+            if row["file_path"] not in waiting and os.path.exists(row["file_path"]):
+                os.remove(row["file_path"])
+
+    def list_jobs(self) -> List[Dict]:
+        """Returns every job, oldest first; trace holds the JSON timing breakdown of finished jobs."""
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute("SELECT * FROM jobs ORDER BY job_id")]
+
+def _limited(items: Iterable[T], slots: threading.Semaphore) -> Iterator[T]:
+    """Holds a slot while producing each item, so only so many lazy pipelines do that work at once."""
+    iterator = iter(items)
+    while True:
+        with slots:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+class IngestWorkerPool:
+    """Background threads that work through the job store.
+
+    Text extraction and embedding are limited separately: extraction is
+    CPU-bound, while embedding requests all go to the same Ollama server.
+    """
+
+    def __init__(
+        self,
+        store: IngestJobStore,
+        workers: int = 2,
+        extract_concurrency: int = 2,
+        embed_concurrency: int = 1,
+        poll_interval: float = 2.0,
+    ):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.extract_slots = threading.BoundedSemaphore(extract_concurrency)
+        self.embed_slots = threading.BoundedSemaphore(embed_concurrency)
+        self._wakeup = threading.Event()
+        resumed = store.requeue_interrupted()
+        if resumed:
+            logging.info(f"Resuming {resumed} interrupted ingestion jobs.")
+        self._threads = [
+            threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, file, file_name: str, file_hash: str) -> Optional[int]:
+        """Queues an uploaded file for ingestion and wakes an idle worker."""
+        job_id = self.store.enqueue(file, file_name, file_hash)
+        self._wakeup.set()
+        return job_id
+
+    def _work(self):
+        while True:
+            job = self.store.claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run_job(job)
+            except Exception as e:
+                logging.error(f"An error occurred while ingesting '{job['file_name']}': {e}")
+                self.store.finish(job["job_id"], FAILED, str(e))
+
+    def _run_job(self, job: Dict):
+        if is_document_already_processed(job["file_name"], job["file_hash"]):
+            self.store.finish(job["job_id"], DONE)
+            return
+        # FileIO lets the copy carry the uploaded name, which the extractors and chunk metadata use
+        file = io.FileIO(job["file_path"], "rb")
+        file.name = job["file_name"]
+        with file, start_trace("ingest", file_name=job["file_name"], job_id=job["job_id"]) as trace:
+            splits = iter_document_splits(
+                file,
+                chunk_size=config["chunk_size"],
+                chunk_overlap=config["chunk_overlap"],
+            )
+            error = None
+            try:
+                add_to_vector_collection(
+                    _limited(splits, self.extract_slots),
+                    job["file_name"],
+                    job["file_hash"],
+                    embed_slot=self.embed_slots,
+                    on_progress=lambda chunks: self.store.set_progress(job["job_id"], chunks),
+                    raise_errors=True,
+                )
+            except Exception as e:
+                # Kept on the job, so the sidebar shows why it failed
+                error = str(e) or type(e).__name__
+        breakdown = trace.to_dict(include_spans=False)
+        if error is None:
+            self.store.finish(job["job_id"], DONE, trace=breakdown)
+        else:
+            self.store.finish(job["job_id"], FAILED, error, breakdown)
+
+_pool_lock = threading.Lock()
+_pool: Optional[IngestWorkerPool] = None
+
+def get_ingest_pool() -> IngestWorkerPool:
+    """Returns the process-wide worker pool, starting it (and resuming unfinished jobs) on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            store = IngestJobStore(
+                config.get("ingest_jobs_path", os.path.join(config["vector_store_path"], "ingest_jobs.db"))
+            )
+            _pool = IngestWorkerPool(
+                store,
+                workers=config.get("ingest_workers", 2),
+                extract_concurrency=config.get("ingest_extract_concurrency", os.cpu_count() or 1),
+                embed_concurrency=config.get("ingest_embed_concurrency", 1),
+                poll_interval=config.get("ingest_poll_interval", 2.0),
+            )
+        return _pool
@@ -0,0 +1,164 @@
+# ingestion_manifest.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+def content_hash(data: bytes) -> str:
+    """Returns the SHA-256 hex digest of raw bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def text_hash(text: str) -> str:
+    """Returns the SHA-256 hex digest of a text chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def file_content_hash(file) -> str:
+    """Hashes an uploaded file's contents and rewinds it for later reads."""
+    file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(1 << 20), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+class IngestionManifest:
+    """Persistent record of ingested files and the hashes of their chunks.
+
+    It doubles as the document registry: listing documents and finding a
+    document's chunk ids never has to scan the vector collection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    file_name TEXT PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    ingested_at REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    file_name TEXT NOT NULL,
+                    chunk_hash TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS chunks_by_file ON chunks (file_name);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                """
+            )
+            # Manifests written before the registry columns existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+            if "chunk_count" not in columns:
+                conn.execute("ALTER TABLE files ADD COLUMN chunk_count INTEGER NOT NULL DEFAULT 0")
+                conn.execute(
+                    "UPDATE files SET chunk_count = "
+                    "(SELECT COUNT(*) FROM chunks WHERE chunks.file_name = files.file_name)"
+                )
+            if "ingested_at" not in columns:
+                conn.execute("ALTER TABLE files ADD COLUMN ingested_at REAL NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            conn = sqlite3.connect(self.path)
+            try:
+                with conn:
+                    yield conn
+            finally:
+                conn.close()
+
+    def get_file_hash(self, file_name: str) -> Optional[str]:
+        """Returns the content hash recorded for a file, if it was ingested."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT file_hash FROM files WHERE file_name = ?", (file_name,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_chunk_hashes(self, file_name: str) -> Dict[str, str]:
+        """Returns a mapping of chunk id to chunk text hash for a file."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT chunk_id, chunk_hash FROM chunks WHERE file_name = ?", (file_name,)
+            ).fetchall()
+        return dict(rows)
+
+    def record_document(
+        self, file_name: str, file_hash: Optional[str], chunks: Dict[str, str], ingested_at: Optional[float] = None
+    ):
+        """Replaces the manifest entry for a file with its current chunks.
+
+        ingested_at should be the time stamped on the chunks, so date filters agree
+        with the registry; it defaults to now.
+        """
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chunks WHERE file_name = ?", (file_name,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, file_name, chunk_hash) VALUES (?, ?, ?)",
+                [(chunk_id, file_name, chunk_hash) for chunk_id, chunk_hash in chunks.items()],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO files (file_name, file_hash, chunk_count, ingested_at) "
+                "VALUES (?, ?, ?, ?)",
+                (file_name, file_hash or "", len(chunks), time.time() if ingested_at is None else ingested_at),
+            )
+
+    def add_chunks(self, file_name: str, chunks: Dict[str, str]):
+        """Records chunks already stored for a file while it is still being ingested.
+
+        A run that is interrupted can then treat them as unchanged instead of embedding them again.
+        """
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, file_name, chunk_hash) VALUES (?, ?, ?)",
+                [(chunk_id, file_name, chunk_hash) for chunk_id, chunk_hash in chunks.items()],
+            )
+
+    def remove_document(self, file_name: str):
+        """Forgets a file and all of its chunks."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chunks WHERE file_name = ?", (file_name,))
+            conn.execute("DELETE FROM files WHERE file_name = ?", (file_name,))
+
+    def get_chunk_ids(self, file_name: str) -> List[str]:
+        """Returns the ids of all chunks stored for a file."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT chunk_id FROM chunks WHERE file_name = ?", (file_name,)).fetchall()
+        return [row[0] for row in rows]
+
+    def list_documents(self) -> List[Dict]:
+        """Returns file name, hash, chunk count and ingest time for every document, by name."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT file_name, file_hash, chunk_count, ingested_at FROM files ORDER BY file_name"
+            ).fetchall()
+        return [
+            {"file_name": name, "file_hash": file_hash, "chunk_count": chunk_count, "ingested_at": ingested_at}
+            for name, file_hash, chunk_count, ingested_at in rows
+        ]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        """Returns a setting stored alongside the manifest, such as the vector store layout."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def is_empty(self) -> bool:
+        """Checks whether no document has been recorded yet."""
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
@@ -0,0 +1,104 @@
+# keyword_extraction.py
+
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+from provider_database import provider_index
+
+class KeywordMatcher:
+    """Aho–Corasick automaton that finds every whole-word keyword in a text in one pass.
+
+    Matching is case-insensitive (casefolded). Adding keywords extends a copy of the
+    existing trie and swaps it in, so concurrent lookups are never disturbed.
+    """
+
+    def __init__(self, keywords: Iterable[str] = ()):
+        self.keywords: Set[str] = set()
+        # Node 0 is the root: goto edges per node, keywords ending exactly at each node
+        self._goto: List[Dict[str, int]] = [{}]
+        self._terminal: List[List[str]] = [[]]
+        # (goto, failure links, outputs) used by find_all, replaced as one unit
+        self._tables = (self._goto, [0], [[]])
+        self.add(keywords)
+
+    def add(self, keywords: Iterable[str]):
+        """Inserts keywords into the trie and refreshes the failure links."""
+        new_keywords = {keyword.casefold().strip() for keyword in keywords} - self.keywords
+        new_keywords.discard("")
+        if not new_keywords:
+            return
+        goto = [dict(edges) for edges in self._goto]
+        terminal = [list(words) for words in self._terminal]
+        for keyword in new_keywords:
+            node = 0
+            for char in keyword:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto.append({})
+                    terminal.append([])
+                    goto[node][char] = next_node
+                node = next_node
+            terminal[node].append(keyword)
+
+        fail = [0] * len(goto)
+        output = [list(words) for words in terminal]
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                fallback = fail[node]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(char, 0) if node else 0
+                # A node also reports every keyword that ends at its failure target
+                output[child] = output[child] + output[fail[child]]
+                queue.append(child)
+
+        self._goto, self._terminal = goto, terminal
+        self._tables = (goto, fail, output)
+        self.keywords = self.keywords | new_keywords
+
+    def find_all(self, text: str) -> List[str]:
+        """Returns the distinct keywords occurring as whole words in text, in order of appearance."""
+        goto, fail, output = self._tables
+        text = text.casefold()
+        found: Dict[str, None] = {}
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for keyword in output[node]:
+                start = end - len(keyword) + 1
+                before_ok = start == 0 or not text[start - 1].isalnum()
+                after_ok = end + 1 == len(text) or not text[end + 1].isalnum()
+                if before_ok and after_ok:
+                    found.setdefault(keyword)
+        return list(found)
+
+_matcher_lock = threading.Lock()
+_matcher = KeywordMatcher()
+_matcher_version = None
+
+def get_provider_keyword_matcher() -> KeywordMatcher:
+    """Returns a matcher over all provider keywords, updated when the provider file changes."""
+    global _matcher, _matcher_version
+    provider_index.refresh()
+    if provider_index.version == _matcher_version:
+        return _matcher
+    with _matcher_lock:
+        if provider_index.version != _matcher_version:
+            keywords = {k.casefold().strip() for p in provider_index.providers for k in p["keywords"]}
+            if _matcher.keywords - keywords:
+                # Keywords were removed, which a trie cannot undo cheaply
+                _matcher = KeywordMatcher(keywords)
+            else:
+                _matcher.add(keywords - _matcher.keywords)
+            _matcher_version = provider_index.version
+    return _matcher
+
+def extract_provider_keywords(question: str) -> List[str]:
+    """Finds every provider keyword mentioned in a question."""
+    return get_provider_keyword_matcher().find_all(question)
@@ -1,19 +1,24 @@
 # llm_interface.py
 
 import logging
-from typing import Generator
+import threading
+import time
+from typing import Generator, Optional
 
-import ollama
 import streamlit as st
-import yaml
-from deep_translator import GoogleTranslator  # Use deep-translator
 
-def load_config():
-    with open('config.yaml', 'r') as f:
-        return yaml.safe_load(f)
+from config import load_config
+from tracing import record_span
+from translation import GoogleTranslateBackend, Translator
 
 config = load_config()
 
+# Swap the backend (e.g. for translation.PassthroughBackend) to run without network access
+translator = Translator(
+    GoogleTranslateBackend(),
+    max_cache_entries=config.get("translation_cache_max_entries", 10_000),
+)
+
 system_prompt = """
 You are an AI assistant that provides detailed answers based solely on the given context.
 
@@ -34,60 +39,94 @@ Formatting Guidelines:
 Remember: Base your entire response solely on the information provided in the context.
 """
 
-def call_llm(context: str, prompt: str, language: str) -> Generator[str, None, None]:
-    """Calls the language model with context and prompt to generate a response, translating if necessary."""
+def call_llm(
+    context: str,
+    prompt: str,
+    language: str,
+    cancel_event: Optional[threading.Event] = None,
+    metrics: Optional[dict] = None,
+) -> Generator[str, None, None]:
+    """Calls the language model with context and prompt to generate a response, translating if necessary.
+
+    Non-English answers are translated sentence by sentence while generation continues.
+    Generation stops as soon as cancel_event is set. When a metrics dict is passed,
+    it is filled with time_to_first_token (seconds), tokens and tokens_per_second,
+    and "completed" is True only if the model finished its answer and every
+    sentence was translated, so partial answers are never mistaken for full ones.
+    """
+    start = time.perf_counter()
+    first_piece = True
+    if metrics is None:
+        metrics = {}
+    metrics["completed"] = False
     try:
-        # If the selected language is English, stream the response directly
-        if language == 'en':
-            response = ollama.chat(
-                model=config['llm_model'],
-                stream=True,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Context: {context}\nQuestion: {prompt}",
-                    },
-                ],
-            )
-            for chunk in response:
-                if chunk["done"] is False:
-                    yield chunk["message"]["content"]
-                else:
-                    break
-        else:
-            # For other languages, collect the response and translate it
-            response = ollama.chat(
-                model=config['llm_model'],
-                stream=False,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt,
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Context: {context}\nQuestion: {prompt}",
-                    },
-                ],
-            )
-            full_response = response["message"]["content"]
-            translated_text = translate_text(full_response, language)
-            yield translated_text  # Yield the translated text
+        tokens = _stream_chat(context, prompt, cancel_event, metrics, start)
+        if language != 'en':
+            tokens = translator.translate_stream(tokens, language, status=metrics)
+        for piece in tokens:
+            if first_piece:
+                first_piece = False
+                time_to_first_token = time.perf_counter() - start
+                record_span("llm_first_token", time_to_first_token, start)
+                metrics["time_to_first_token"] = time_to_first_token
+            yield piece
+        if metrics.get("translation_failed"):
+            metrics["completed"] = False
     except Exception as e:
+        metrics["completed"] = False
         logging.error(f"An error occurred while generating the response: {e}")
         st.error(f"An error occurred while generating the response: {e}")
+    finally:
+        # Wall time until the answer was fully consumed (or abandoned)
+        record_span("call_llm", time.perf_counter() - start, start, language=language)
 
-def translate_text(text: str, dest_language: str) -> str:
-    """Translates text to the desired language using deep-translator."""
+def _stream_chat(
+    context: str,
+    prompt: str,
+    cancel_event: Optional[threading.Event],
+    metrics: dict,
+    start: float,
+) -> Generator[str, None, None]:
+    """Streams the model's answer tokens from Ollama."""
+    import ollama
+
+    response = ollama.chat(
+        model=config['llm_model'],
+        stream=True,
+        messages=[
+            {
+                "role": "system",
+                "content": system_prompt,
+            },
+            {
+                "role": "user",
+                "content": f"Context: {context}\nQuestion: {prompt}",
+            },
+        ],
+    )
     try:
-        translator = GoogleTranslator(source='auto', target=dest_language)
-        translated = translator.translate(text)
-        return translated
-    except Exception as e:
-        logging.error(f"An error occurred during translation: {e}")
-        st.error(f"An error occurred during translation: {e}")
-        return text  # Return original text if translation fails
\ No newline at end of file
+        for chunk in response:
+            if cancel_event is not None and cancel_event.is_set():
+                logging.info("Answer generation cancelled.")
+                break
+            if chunk["done"] is False:
+                yield chunk["message"]["content"]
+            else:
+                metrics["completed"] = True
+                _record_generation_metrics(metrics, chunk, start)
+                break
+    finally:
+        # Closing the stream makes Ollama stop generating for an abandoned answer
+        response.close()
+
+def _record_generation_metrics(metrics: dict, final_chunk, start: float):
+    """Fills token counts and decode speed from Ollama's final response statistics."""
+    metrics["total_time"] = time.perf_counter() - start
+    tokens = final_chunk.get("eval_count") or 0
+    eval_seconds = (final_chunk.get("eval_duration") or 0) / 1e9
+    metrics["tokens"] = tokens
+    metrics["tokens_per_second"] = tokens / eval_seconds if eval_seconds else 0.0
+
+def translate_text(text: str, dest_language: str) -> str:
+    """Translates text to the desired language, reusing earlier translations."""
+    return translator.translate(text, dest_language)
\ No newline at end of file
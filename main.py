@@ -1,24 +1,34 @@
 import os
 import logging
+import threading
+import json
+import time
+from datetime import datetime, time as day_time
+from typing import List, Optional
 
 import streamlit as st
-from streamlit.runtime.state import SessionState
 
-from document_processing import process_document, is_document_already_processed
+from document_processing import is_document_already_processed
+from ingest_jobs import get_ingest_pool
+from ingestion_manifest import file_content_hash
+from answer_cache import CachedAnswer
+from context_packer import pack_context
+from retrieval_filters import build_where
 from vector_store import (
-    add_to_vector_collection,
+    answer_cache,
+    embed_query,
     query_collection,
-    list_uploaded_documents,
+    list_document_records,
     delete_document,
 )
 from llm_interface import call_llm
-# from chat import chat_interface  # currently commented out
-from utils import re_rank_cross_encoders, normalize_scores, get_confidence_color
-from deep_translator import GoogleTranslator
-import yaml
+from chat import chat_interface
+from utils import re_rank_cross_encoders, normalize_scores, get_confidence_color, combine_confidence
+from config import load_config
+from tracing import span, start_trace
 
-# NEW IMPORT
-from provider_database import find_providers  # Add this line
+from provider_database import find_providers
+from keyword_extraction import extract_provider_keywords
 
 # Configure logging
 logging.basicConfig(
@@ -27,12 +37,264 @@ logging.basicConfig(
 
 st.set_page_config(page_title="RAG Question Answer", layout="wide")
 
-def load_config():
-    with open("config.yaml", "r") as f:
-        return yaml.safe_load(f)
-
 config = load_config()
 
+def show_confidence(confidence_score: float):
+    """Displays the overall confidence score, colored by level."""
+    color = get_confidence_color(confidence_score)
+    st.markdown(f"**Confidence Score:** <span style='color:{color}'>{confidence_score:.2f}</span>", unsafe_allow_html=True)
+
+def show_answer_metrics(answer_metrics: dict):
+    """Displays and records perceived latency figures for a generated answer."""
+    if "time_to_first_token" not in answer_metrics:
+        return
+    logging.info(f"Answer metrics: {answer_metrics}")
+    history = st.session_state.setdefault("answer_metrics_history", [])
+    history.append(answer_metrics)
+    # Keep only recent answers so long sessions do not grow without bound
+    del history[:-config.get("answer_metrics_history_size", 100)]
+    st.caption(
+        f"First token after {answer_metrics['time_to_first_token']:.2f}s, "
+        f"{answer_metrics.get('tokens_per_second', 0.0):.1f} tokens/sec"
+    )
+
+def show_trace_breakdown(trace: dict):
+    """Displays how long each stage of the last request took."""
+    with st.expander(f"Timing breakdown ({trace['duration_ms']:.0f} ms total)", expanded=False):
+        total = trace["duration_ms"] or 1.0
+        st.table([
+            {
+                "Stage": stage["stage"],
+                "Calls": stage["calls"],
+                "Total (ms)": f"{stage['total_ms']:.1f}",
+                "Share": f"{stage['total_ms'] / total:.0%}",
+            }
+            for stage in trace["stages"]
+        ])
+        st.caption(f"Trace {trace['trace_id']}")
+
+@st.fragment(run_every=config.get("ingest_progress_refresh", 2))
+def show_ingest_jobs(show_timings: bool = False):
+    """Displays the progress of background ingestion jobs, refreshing on its own while they run.
+
+    With show_timings, the timing breakdown of the most recently finished job is shown too.
+    """
+    store = get_ingest_pool().store
+    jobs = store.list_jobs()
+    if not jobs:
+        return
+    finished = sum(job["status"] == "done" for job in jobs)
+    st.progress(finished / len(jobs), text=f"Ingested {finished} of {len(jobs)} documents")
+    for job in jobs:
+        if job["status"] == "running":
+            st.caption(f"⏳ {job['file_name']}: {job['chunks_done']} chunks stored")
+        elif job["status"] == "queued":
+            st.caption(f"🕒 {job['file_name']}: queued")
+        elif job["status"] == "done":
+            st.caption(f"✅ {job['file_name']}")
+        else:
+            st.caption(f"❌ {job['file_name']}: {job['error']}")
+    traced_jobs = [job for job in jobs if job["trace"]]
+    if show_timings and traced_jobs:
+        show_trace_breakdown(json.loads(max(traced_jobs, key=lambda job: job["updated_at"])["trace"]))
+    if any(job["status"] == "failed" for job in jobs) and st.button("Retry failed", key="retry_ingest_jobs"):
+        store.retry_failed()
+    if finished and st.button("Clear finished", key="clear_ingest_jobs"):
+        store.clear_finished()
+        st.rerun()
+
+def show_sources_and_download(answer: str, sources: List[str]):
+    """Displays the answer's sources and a button to download both."""
+    st.subheader("Sources")
+    for source_info in sources:
+        st.markdown(source_info)
+
+    # Combine answer and sources into downloadable content
+    download_content = f"**Answer:**\n{answer}\n\n**Sources:**\n" + "\n".join(sources)
+
+    # Add a download button
+    st.download_button(
+        label="Download Answer and Sources",
+        data=download_content,
+        file_name="answer_and_sources.txt",
+        mime="text/plain",
+    )
+
+def show_service_providers(question: str, user_location: str):
+    """Recommends service providers matching keywords in the question."""
+    # Find every provider keyword mentioned in the question in a single pass
+    query_keywords = extract_provider_keywords(question)
+
+    if query_keywords:
+        providers = find_providers(query_keywords, user_location if user_location else None)
+        st.markdown("### Relevant Service Providers")
+        if providers:
+            st.markdown("### Relevant Service Providers")
+            
+            # Define a card style with a slight border, padding, and maybe a shadow.
+            card_style = """
+            <style>
+            .provider-card {
+                background-color: #f9f9f9;
+                border-radius: 8px;
+                padding: 10px;
+                margin-bottom: 15px;
+                box-shadow: 0 0 5px rgba(0,0,0,0.1);
+            }
+            .provider-name {
+                font-weight: bold;
+                font-size: 1.1em;
+                color: #333;
+                margin-bottom: 5px;
+            }
+            .provider-type {
+                font-style: italic;
+                color: #555;
+                margin-bottom: 5px;
+            }
+            .provider-location {
+                color: #666;
+                margin-bottom: 5px;
+            }
+            .provider-keywords {
+                color: #888;
+                font-size: 0.9em;
+            }
+            </style>
+            """
+
+            st.markdown(card_style, unsafe_allow_html=True)
+
+            for p in providers:
+                # Format provider info as a styled card
+                provider_card = f"""
+                <div class="provider-card">
+                    <div class="provider-name">{p['name']}</div>
+                    <div class="provider-type">{p['type_of_practice']}</div>
+                    <div class="provider-location">Location: {p['location']}</div>
+                    <div class="provider-keywords">Keywords: {', '.join(p['keywords'])}</div>
+                </div>
+                """
+                st.markdown(provider_card, unsafe_allow_html=True)
+        else:
+            st.info("No matching providers found.")
+    else:
+        st.info("No specific symptom keywords recognized. No provider recommendations displayed.")
+
+def answer_question(
+    question: str,
+    n_results: int,
+    selected_language: str,
+    user_location: str,
+    where: Optional[dict] = None,
+):
+    """Answers a question from the cache or the document collection and renders the result.
+
+    where limits retrieval to matching chunks (see build_where).
+    """
+    # Reuse the answer to an equivalent earlier question while the documents are unchanged
+    cache_scope = (selected_language, n_results, json.dumps(where, sort_keys=True))
+    cache_generation = answer_cache.generation
+    question_embedding = embed_query(question)
+    cached_answer = None
+    if question_embedding is not None:
+        with span("answer_cache_lookup"):
+            cached_answer = answer_cache.lookup(question_embedding, cache_scope)
+    if cached_answer:
+        show_confidence(cached_answer.confidence)
+        st.markdown(cached_answer.answer)
+        show_sources_and_download(cached_answer.answer, cached_answer.sources)
+        show_service_providers(question, user_location)
+    else:
+        # Query the vector store and generate an answer
+        results = query_collection(question, n_results, query_embedding=question_embedding, where=where)
+        if results and 'documents' in results and 'distances' in results:
+            documents = results['documents'][0]  # Assuming single query
+            distances = results['distances'][0]
+            metadatas = results['metadatas'][0]  # Retrieve metadata
+            # Normalize retrieval scores
+            retrieval_scores = normalize_scores(distances)
+            # Re-rank documents
+            _, relevant_indices, re_rank_scores = re_rank_cross_encoders(
+                question,
+                documents,
+                ids=results['ids'][0],
+                # Every candidate is ranked; pack_context stops at the token budget
+                top_k=None,
+                score_threshold=config.get("rerank_score_threshold"),
+                batch_size=config.get("rerank_batch_size", 32),
+                max_length=config.get("rerank_max_length", 512),
+            )
+            # Confidence reflects the best few chunks only
+            confidence_top_k = config.get("rerank_top_k", 3)
+            confidence_score = combine_confidence(
+                retrieval_scores, relevant_indices[:confidence_top_k], re_rank_scores[:confidence_top_k]
+            )
+            show_confidence(confidence_score)
+            # Merge overlapping chunks and fit the context to the model's token budget
+            context, context_indices = pack_context(
+                documents,
+                metadatas,
+                relevant_indices,
+                re_rank_scores,
+                token_budget=config.get("context_token_budget", 1500),
+                max_overlap=config["chunk_overlap"],
+                duplicate_threshold=config.get("context_duplicate_threshold", 0.8),
+            )
+            # A newer question supersedes any answer still being generated for this session
+            previous_cancel_event = st.session_state.get("answer_cancel_event")
+            if previous_cancel_event is not None:
+                previous_cancel_event.set()
+            cancel_event = threading.Event()
+            st.session_state["answer_cancel_event"] = cancel_event
+            # Generate the answer
+            answer_metrics = {}
+            response_generator = call_llm(
+                context,
+                question,
+                selected_language,
+                cancel_event=cancel_event,
+                metrics=answer_metrics,
+            )
+            # Display the answer using a placeholder
+            answer_placeholder = st.empty()
+            full_response = ""
+
+            # Render tokens as they arrive, throttled so the browser is not flooded with updates
+            last_render = 0.0
+            for chunk in response_generator:
+                full_response += chunk
+                if time.monotonic() - last_render > 0.05:
+                    answer_placeholder.markdown(full_response + "▌")
+                    last_render = time.monotonic()
+
+            # call_llm already returns the answer in the selected language
+            answer = full_response
+            answer_placeholder.markdown(answer)
+            show_answer_metrics(answer_metrics)
+
+            sources = []
+            for i, idx in enumerate(context_indices):
+                metadata = metadatas[idx]
+                file_name = metadata.get('file_name', 'Unknown')
+                chunk_number = metadata.get('chunk', 'N/A')
+                sources.append(f"**Source {i+1}:** {file_name} (Chunk {chunk_number})")
+            show_sources_and_download(answer, sources)
+
+            # Answers cut short (error, cancellation) or left untranslated must not be reused
+            completed = answer_metrics.get("completed") and not cancel_event.is_set()
+            if question_embedding is not None and answer and completed:
+                answer_cache.put(
+                    question_embedding,
+                    cache_scope,
+                    CachedAnswer(question, answer, sources, confidence_score),
+                    cache_generation,
+                )
+
+            show_service_providers(question, user_location)
+        else:
+            st.warning("No relevant documents found.")
+
 def main():
     # Sidebar
     with st.sidebar:
@@ -50,6 +312,7 @@ def main():
         selected_language = language_options[selected_language_name]
         # Store the selected language code in session state
         st.session_state['selected_language'] = selected_language
+        show_timings = st.checkbox("Show timing breakdown", value=config.get("debug_panel", False))
 
         # File uploader
         uploaded_files = st.file_uploader(
@@ -59,24 +322,21 @@ def main():
         )
         if st.button("Process Documents"):
             if uploaded_files:
-                with st.spinner("Processing documents..."):
-                    for uploaded_file in uploaded_files:
-                        # Check if the document has already been processed
-                        if is_document_already_processed(uploaded_file.name):
-                            st.warning(
-                                f"Document '{uploaded_file.name}' has already been processed."
-                            )
-                            continue
-                        # Process the document
-                        docs = process_document(
-                            uploaded_file,
-                            chunk_size=config["chunk_size"],
-                            chunk_overlap=config["chunk_overlap"],
+                # Documents are ingested by background workers, so the session stays responsive
+                ingest_pool = get_ingest_pool()
+                for uploaded_file in uploaded_files:
+                    # Skip documents whose content has not changed since the last upload
+                    file_hash = file_content_hash(uploaded_file)
+                    if is_document_already_processed(uploaded_file.name, file_hash):
+                        st.warning(
+                            f"Document '{uploaded_file.name}' has already been processed."
                         )
-                        # Add to vector collection
-                        add_to_vector_collection(docs, uploaded_file.name)
+                        continue
+                    if ingest_pool.submit(uploaded_file, uploaded_file.name, file_hash) is None:
+                        st.info(f"Document '{uploaded_file.name}' is already queued.")
             else:
                 st.warning("Please upload at least one document.")
+        show_ingest_jobs(show_timings)
 
     # Main Content
     tab1, tab2, tab3 = st.tabs(["Ask Questions", "Document Library", "Chat"])
@@ -86,152 +346,56 @@ def main():
         question = st.text_area("Enter your question:", key="question_input")
         n_results = st.slider("Number of documents to use:", 1, 20, 10, key="n_results_slider")
 
+        # Optional filters narrowing retrieval to part of the library
+        with st.expander("Search only in..."):
+            filter_records = list_document_records()
+            selected_documents = st.multiselect(
+                "Documents:", [record["file_name"] for record in filter_records], key="filter_documents"
+            )
+            file_type_options = sorted({
+                os.path.splitext(record["file_name"])[1].lower().lstrip(".") for record in filter_records
+            } - {""})
+            selected_file_types = st.multiselect("File types:", file_type_options, key="filter_file_types")
+            ingested_since = st.date_input("Ingested on or after:", value=None, key="filter_ingested_since")
+        where = build_where(
+            documents=selected_documents,
+            file_types=selected_file_types,
+            ingested_after=(
+                datetime.combine(ingested_since, day_time.min).timestamp() if ingested_since else None
+            ),
+        )
+
         # NEW: Optional location input for filtering providers
         user_location = st.text_input("Enter your city (optional):")
 
         if st.button("Get Answer", key="get_answer_button"):
             if question:
                 with st.spinner("Retrieving answer..."):
-                    # Query the vector store and generate an answer
-                    results = query_collection(question, n_results)
-                    if results and 'documents' in results and 'distances' in results:
-                        documents = results['documents'][0]  # Assuming single query
-                        distances = results['distances'][0]
-                        metadatas = results['metadatas'][0]  # Retrieve metadata
-                        # Normalize retrieval scores
-                        retrieval_scores = normalize_scores(distances)
-                        # Re-rank documents
-                        relevant_text, relevant_indices, re_rank_scores = re_rank_cross_encoders(question, documents)
-                        # Combine scores for the top documents
-                        combined_scores = []
-                        for i in range(len(relevant_indices)):
-                            idx = relevant_indices[i]
-                            combined_score = (retrieval_scores[idx] + re_rank_scores[i]) / 2
-                            combined_scores.append(combined_score)
-                        # Compute overall confidence score
-                        if combined_scores:
-                            confidence_score = sum(combined_scores) / len(combined_scores)
-                        else:
-                            confidence_score = 0.0
-                        # Display the confidence score
-                        color = get_confidence_color(confidence_score)
-                        st.markdown(f"**Confidence Score:** <span style='color:{color}'>{confidence_score:.2f}</span>", unsafe_allow_html=True)
-                        # Retrieve the selected language
-                        selected_language = st.session_state.get('selected_language', 'en')
-                        # Generate the answer
-                        response_generator = call_llm(relevant_text, question, selected_language)
-                        # Display the answer using a placeholder
-                        answer_placeholder = st.empty()
-                        full_response = ""
-
-                        # Collect the full response
-                        for chunk in response_generator:
-                            full_response += chunk
-
-                        if selected_language == 'en':
-                            # Display the response in English
-                            answer_placeholder.markdown(full_response)
-                        else:
-                            # Translate and display the response
-                            translated_answer = GoogleTranslator(source='auto', target=selected_language).translate(full_response)
-                            answer_placeholder.markdown(translated_answer)
-
-                        # Display sources
-                        st.subheader("Sources")
-                        sources = []
-                        for i, idx in enumerate(relevant_indices):
-                            metadata = metadatas[idx]
-                            file_name = metadata.get('file_name', 'Unknown')
-                            chunk_number = metadata.get('chunk', 'N/A')
-                            source_info = f"**Source {i+1}:** {file_name} (Chunk {chunk_number})"
-                            st.markdown(source_info)
-                            sources.append(source_info)
-
-                        # Combine answer and sources into downloadable content
-                        download_content = f"**Answer:**\n{full_response}\n\n**Sources:**\n" + "\n".join(sources)
-
-                        # Add a download button
-                        st.download_button(
-                            label="Download Answer and Sources",
-                            data=download_content,
-                            file_name="answer_and_sources.txt",
-                            mime="text/plain",
-                        )
-
-                        # NEW: Integrate provider search
-                        # Extract keywords from user query (basic example)
-                        query_keywords = []
-                        # For demonstration, if "headache" in question
-                        if "headache" in question.lower():
-                            query_keywords.append("headache")
-                        # Add more keyword logic if needed
-
-                        if query_keywords:
-                            providers = find_providers(query_keywords, user_location if user_location else None)
-                            st.markdown("### Relevant Service Providers")
-                            if providers:
-                                st.markdown("### Relevant Service Providers")
-                                
-                                # Define a card style with a slight border, padding, and maybe a shadow.
-                                card_style = """
-                                <style>
-                                .provider-card {
-                                    background-color: #f9f9f9;
-                                    border-radius: 8px;
-                                    padding: 10px;
-                                    margin-bottom: 15px;
-                                    box-shadow: 0 0 5px rgba(0,0,0,0.1);
-                                }
-                                .provider-name {
-                                    font-weight: bold;
-                                    font-size: 1.1em;
-                                    color: #333;
-                                    margin-bottom: 5px;
-                                }
-                                .provider-type {
-                                    font-style: italic;
-                                    color: #555;
-                                    margin-bottom: 5px;
-                                }
-                                .provider-location {
-                                    color: #666;
-                                    margin-bottom: 5px;
-                                }
-                                .provider-keywords {
-                                    color: #888;
-                                    font-size: 0.9em;
-                                }
-                                </style>
-                                """
-
-                                st.markdown(card_style, unsafe_allow_html=True)
-
-                                for p in providers:
-                                    # Format provider info as a styled card
-                                    provider_card = f"""
-                                    <div class="provider-card">
-                                        <div class="provider-name">{p['name']}</div>
-                                        <div class="provider-type">{p['type_of_practice']}</div>
-                                        <div class="provider-location">Location: {p['location']}</div>
-                                        <div class="provider-keywords">Keywords: {', '.join(p['keywords'])}</div>
-                                    </div>
-                                    """
-                                    st.markdown(provider_card, unsafe_allow_html=True)
-                            else:
-                                st.info("No matching providers found.")
-                        else:
-                            st.info("No specific symptom keywords recognized. No provider recommendations displayed.")
-                    else:
-                        st.warning("No relevant documents found.")
+                    # Retrieve the selected language
+                    selected_language = st.session_state.get('selected_language', 'en')
+                    with start_trace(
+                        "query", language=selected_language, n_results=n_results, filtered=where is not None
+                    ) as trace:
+                        answer_question(question, n_results, selected_language, user_location, where)
+                    st.session_state["last_trace"] = trace.to_dict()
             else:
                 st.warning("Please enter a question.")
 
+        if show_timings and st.session_state.get("last_trace"):
+            show_trace_breakdown(st.session_state["last_trace"])
+
     with tab2:
         st.header("Your Documents")
-        documents = list_uploaded_documents()
-        if documents:
-            for doc in documents:
+        document_records = list_document_records()
+        if document_records:
+            for record in document_records:
+                doc = record["file_name"]
                 st.markdown(f"**{doc}**")
+                ingested = (
+                    datetime.fromtimestamp(record["ingested_at"]).strftime("%Y-%m-%d %H:%M")
+                    if record["ingested_at"] else "unknown"
+                )
+                st.caption(f"{record['chunk_count']} chunks, ingested {ingested}")
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button(f"Reprocess {doc}", key=f"reprocess_{doc}"):
@@ -246,8 +410,8 @@ def main():
         else:
             st.info("No documents uploaded yet.")
 
-    # with tab3:
-    #     chat_interface()
+    with tab3:
+        chat_interface()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
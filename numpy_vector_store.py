@@ -0,0 +1,524 @@
+# numpy_vector_store.py
+
+import json
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from file_lock import exclusive_file_lock
+
+# Rows scored per step, which bounds the float32 working copy during a scan
+SCORE_BLOCK_ROWS = 8192
+
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+def where_to_sql(where: Dict[str, Any]) -> Tuple[str, list]:
+    """Translates a Chroma-style metadata filter into an SQL condition on the JSON metadata column."""
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key in ("$and", "$or"):
+            parts = [where_to_sql(sub) for sub in condition]
+            joiner = " AND " if key == "$and" else " OR "
+            clauses.append("(" + joiner.join(sql for sql, _ in parts) + ")")
+            for _, sub_params in parts:
+                params += sub_params
+            continue
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                placeholders = ",".join("?" * len(value))
+                negate = "NOT " if operator == "$nin" else ""
+                clauses.append(f"json_extract(metadata, ?) {negate}IN ({placeholders})")
+                params += [f'$."{key}"', *value]
+            elif operator in _OPERATORS:
+                clauses.append(f"json_extract(metadata, ?) {_OPERATORS[operator]} ?")
+                params += [f'$."{key}"', value]
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+    return " AND ".join(clauses) or "1", params
+
+class NumpyCollection:
+    """Vector collection kept in memory-mapped NumPy files, with a Chroma-compatible API.
+
+    Embeddings are L2-normalized and stored as float16, or as int8 with one scale
+    per row; distances are cosine distances like Chroma's "cosine" space. Queries
+    scan all rows exactly, or with ivf_lists > 0 only the rows of the ivf_probes
+    closest k-means lists, which are then scored exactly. The rows of each list are
+    kept in memory as an inverted list, so a query only touches the probed lists.
+    Documents and metadata live in SQLite. Opening is cheap: files are mapped, not read.
+
+    Several processes may write to one collection: each write holds a file lock
+    and first adopts the state (row count, capacity, free rows) that other
+    processes left, which state.json marks with a version number.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedding_function=None,
+        dtype: str = "float16",
+        ivf_lists: int = 0,
+        ivf_probes: int = 8,
+    ):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported dtype '{dtype}', use float16 or int8")
+        self.path = path
+        self.embedding_function = embedding_function
+        self.dtype = np.dtype(dtype)
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "metadata.db"), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    chunk_id TEXT PRIMARY KEY,
+                    row INTEGER NOT NULL UNIQUE,
+                    document TEXT,
+                    metadata TEXT
+                )
+                """
+            )
+        self._state = self._read_state()
+        if self._state.get("dtype", dtype) != dtype:
+            raise ValueError(f"Index at {path} stores {self._state['dtype']} vectors, not {dtype}")
+        self._vectors = self._scales = self._alive = self._lists = None
+        self._centroids: Optional[np.ndarray] = None
+        if self._state["capacity"]:
+            self._map_files()
+        centroids_path = os.path.join(path, "centroids.npy")
+        if os.path.exists(centroids_path):
+            self._centroids = np.load(centroids_path)
+        # chunk id -> row and the reusable rows, only needed for writes
+        self._id_to_row: Optional[Dict[str, int]] = None
+        self._free_rows: List[int] = []
+        # Rows of each IVF list, built on the first IVF query. Rows that moved or were
+        # deleted stay behind as stale entries until the lists are rebuilt.
+        self._inverted: Optional[List[array]] = None
+        self._stale_entries = 0
+
+    # Files and state
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self._file("state.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"dim": None, "dtype": self.dtype.name, "size": 0, "capacity": 0, "ivf_trained_rows": 0}
+
+    def _write_state(self):
+        self._state["version"] = self._state.get("version", 0) + 1
+        temporary = self._file("state.json.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self._state, f)
+        os.replace(temporary, self._file("state.json"))
+
+    def _map_files(self):
+        capacity, dim = self._state["capacity"], self._state["dim"]
+        self._vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r+", shape=(capacity, dim))
+        self._alive = np.memmap(self._file("alive.bin"), dtype=np.uint8, mode="r+", shape=(capacity,))
+        self._lists = np.memmap(self._file("lists.bin"), dtype=np.int32, mode="r+", shape=(capacity,))
+        if self.dtype == np.int8:
+            self._scales = np.memmap(self._file("scales.bin"), dtype=np.float32, mode="r+", shape=(capacity,))
+
+    def _grow(self, needed: int):
+        """Extends every per-row file to hold at least needed rows."""
+        capacity = self._state["capacity"]
+        if needed <= capacity:
+            return
+        new_capacity = max(1024, capacity * 2, needed)
+        files = [("vectors.bin", self.dtype.itemsize * self._state["dim"]), ("alive.bin", 1), ("lists.bin", 4)]
+        if self.dtype == np.int8:
+            files.append(("scales.bin", 4))
+        self._flush()
+        for name, row_bytes in files:
+            with open(self._file(name), "ab") as f:
+                f.truncate(new_capacity * row_bytes)
+        if capacity == 0 or self._lists is None:
+            np.memmap(self._file("lists.bin"), dtype=np.int32, mode="r+", shape=(new_capacity,))[:] = -1
+        else:
+            extension = np.memmap(self._file("lists.bin"), dtype=np.int32, mode="r+", shape=(new_capacity,))
+            extension[capacity:] = -1
+            extension.flush()
+        self._state["capacity"] = new_capacity
+        self._map_files()
+
+    def _sync(self):
+        """Adopts writes other processes made since this one last wrote or synced; needs self._lock."""
+        state = self._read_state()
+        if state.get("version", 0) == self._state.get("version", 0):
+            return
+        capacity_changed = state["capacity"] != self._state["capacity"]
+        retrained = state.get("ivf_trained_rows") != self._state.get("ivf_trained_rows")
+        self._state = state
+        if capacity_changed and state["capacity"]:
+            self._map_files()
+        if retrained and os.path.exists(self._file("centroids.npy")):
+            self._centroids = np.load(self._file("centroids.npy"))
+        # Rows may have been taken, freed or moved to other lists
+        self._id_to_row = None
+        self._inverted = None
+
+    def _flush(self):
+        for array in (self._vectors, self._alive, self._lists, self._scales):
+            if array is not None:
+                array.flush()
+
+    def _ensure_ids(self):
+        if self._id_to_row is not None:
+            return
+        self._id_to_row = dict(self._conn.execute("SELECT chunk_id, row FROM chunks"))
+        size = self._state["size"]
+        self._free_rows = [] if self._alive is None else np.flatnonzero(self._alive[:size] == 0).tolist()
+
+    # Vectors
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.dtype == np.float16:
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    def _embed(self, documents: Sequence[str]) -> np.ndarray:
+        if self.embedding_function is None:
+            raise ValueError("No embeddings given and no embedding function configured")
+        return np.asarray(self.embedding_function(list(documents)), dtype=np.float32)
+
+    def _top_k(
+        self, queries: np.ndarray, k: int, size: int, candidate_rows: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k by cosine similarity over all live rows or the given candidate rows."""
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        total = size if candidate_rows is None else len(candidate_rows)
+        for start in range(0, total, SCORE_BLOCK_ROWS):
+            end = min(start + SCORE_BLOCK_ROWS, total)
+            if candidate_rows is None:
+                rows = np.arange(start, end)
+                block = np.asarray(self._vectors[start:end], dtype=np.float32)
+                live = self._alive[start:end] != 0
+            else:
+                rows = candidate_rows[start:end]
+                block = self._vectors[rows].astype(np.float32)
+                live = self._alive[rows] != 0
+            scores = queries @ block.T
+            if self._scales is not None:
+                scores *= self._scales[rows] if candidate_rows is not None else self._scales[start:end]
+            scores[:, ~live] = -np.inf
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(rows, (len(queries), len(rows)))], axis=1)
+            keep = min(k, scores.shape[1])
+            top = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_rows = np.take_along_axis(rows, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    # IVF coarse index
+
+    def _nearest_list(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _ensure_inverted(self, size: int):
+        if self._inverted is not None:
+            return
+        lists = np.asarray(self._lists[:size])
+        order = np.argsort(lists, kind="stable")
+        list_count = len(self._centroids)
+        bounds = np.searchsorted(lists[order], np.arange(list_count + 1))
+        self._inverted = [
+            array("i", order[bounds[i]:bounds[i + 1]].astype(np.int32).tobytes()) for i in range(list_count)
+        ]
+        self._stale_entries = 0
+
+    def _add_to_inverted(self, rows: np.ndarray, lists: np.ndarray, previous_lists: np.ndarray):
+        if self._inverted is None:
+            return
+        for row, list_id in zip(rows.tolist(), lists.tolist()):
+            self._inverted[list_id].append(row)
+        self._stale_entries += int(np.count_nonzero(previous_lists >= 0))
+        self._drop_stale_inverted()
+
+    def _drop_stale_inverted(self):
+        # Rebuilt on the next query once stale entries would double the work of a probe
+        if self._inverted is not None and self._stale_entries > self._state["size"] // 2:
+            self._inverted = None
+
+    def _probe_candidates(self, probes: np.ndarray, size: int) -> np.ndarray:
+        """Returns the sorted rows currently assigned to the probed lists."""
+        with self._lock:
+            self._ensure_inverted(size)
+            candidates = np.unique(
+                np.concatenate([np.frombuffer(self._inverted[list_id], dtype=np.int32) for list_id in probes])
+            )
+        candidates = candidates[candidates < size]
+        return candidates[np.isin(self._lists[candidates], probes)]
+
+    def _maybe_train_ivf(self, seed: int = 0, iterations: int = 10):
+        """Trains k-means lists once there are enough rows, and again whenever the collection doubles."""
+        live_rows = np.flatnonzero(self._alive[:self._state["size"]] != 0)
+        trained = self._state.get("ivf_trained_rows", 0)
+        if len(live_rows) < self.ivf_lists * 39 or (self._centroids is not None and len(live_rows) < 2 * trained):
+            return
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(live_rows, min(len(live_rows), self.ivf_lists * 256), replace=False))
+        sample = self._vectors[sample_rows].astype(np.float32)
+        if self._scales is not None:
+            sample *= self._scales[sample_rows][:, None]
+        sample = self._normalize(sample)
+        centroids = sample[rng.choice(len(sample), self.ivf_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=self.ivf_lists)
+            # Empty lists are re-seeded from random sample vectors
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = self._normalize(sums)
+        self._centroids = centroids.astype(np.float32)
+        for start in range(0, len(live_rows), SCORE_BLOCK_ROWS):
+            rows = live_rows[start:start + SCORE_BLOCK_ROWS]
+            self._lists[rows] = self._nearest_list(self._vectors[rows].astype(np.float32))
+        self._lists.flush()
+        self._inverted = None
+        np.save(self._file("centroids.npy"), self._centroids)
+        self._state["ivf_trained_rows"] = len(live_rows)
+        self._write_state()
+
+    # Chroma-compatible API
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[dict]] = None,
+    ):
+        if not ids:
+            return
+        vectors = self._normalize(
+            np.asarray(embeddings, dtype=np.float32) if embeddings is not None else self._embed(documents)
+        )
+        quantized, scales = self._quantize(vectors)
+        with self._lock, exclusive_file_lock(self._file("write.lock")):
+            self._sync()
+            self._ensure_ids()
+            if self._state["dim"] is None:
+                self._state["dim"] = vectors.shape[1]
+            elif vectors.shape[1] != self._state["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._state['dim']}")
+            rows = []
+            for chunk_id in ids:
+                row = self._id_to_row.get(chunk_id)
+                if row is None:
+                    if self._free_rows:
+                        row = self._free_rows.pop()
+                    else:
+                        row = self._state["size"]
+                        self._state["size"] += 1
+                    self._id_to_row[chunk_id] = row
+                rows.append(row)
+            self._grow(self._state["size"])
+            rows = np.asarray(rows)
+            self._vectors[rows] = quantized
+            if scales is not None:
+                self._scales[rows] = scales
+            if self._centroids is not None:
+                lists = self._nearest_list(vectors)
+                previous_lists = np.asarray(self._lists[rows])
+                self._lists[rows] = lists
+                self._add_to_inverted(rows, lists, previous_lists)
+            else:
+                self._lists[rows] = -1
+            self._alive[rows] = 1
+            self._flush()
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (chunk_id, row, document, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            chunk_id,
+                            int(row),
+                            documents[i] if documents is not None else None,
+                            json.dumps(metadatas[i]) if metadatas is not None and metadatas[i] is not None else None,
+                        )
+                        for i, (chunk_id, row) in enumerate(zip(ids, rows))
+                    ],
+                )
+            self._write_state()
+            if self.ivf_lists:
+                self._maybe_train_ivf()
+
+    def add(self, ids, embeddings=None, documents=None, metadatas=None):
+        self.upsert(ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update(
+        self,
+        ids: List[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[dict]] = None,
+    ):
+        if embeddings is not None or documents is not None:
+            existing = self.get(ids=ids, include=["documents", "metadatas"])
+            by_id = dict(zip(existing["ids"], zip(existing["documents"], existing["metadatas"])))
+            ids = [chunk_id for chunk_id in ids if chunk_id in by_id]
+            self.upsert(
+                ids,
+                embeddings=embeddings,
+                documents=documents if documents is not None else [by_id[i][0] for i in ids],
+                metadatas=metadatas if metadatas is not None else [by_id[i][1] for i in ids],
+            )
+            return
+        if metadatas is None:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE chunks SET metadata = ? WHERE chunk_id = ?",
+                [(json.dumps(metadata) if metadata is not None else None, chunk_id) for chunk_id, metadata in zip(ids, metadatas)],
+            )
+
+    def _select(self, columns: str, ids: Optional[List[str]], where: Optional[dict], limit=None, offset=None) -> list:
+        conditions, params = [], []
+        if where:
+            sql, where_params = where_to_sql(where)
+            conditions.append(sql)
+            params += where_params
+        query = f"SELECT {columns} FROM chunks"
+        if ids is None:
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
+            query += " ORDER BY row"
+            if limit is not None or offset:
+                query += " LIMIT ? OFFSET ?"
+                params += [limit if limit is not None else -1, offset or 0]
+            return self._conn.execute(query, params).fetchall()
+        rows = []
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            id_condition = f"chunk_id IN ({','.join('?' * len(chunk))})"
+            rows += self._conn.execute(
+                query + " WHERE " + " AND ".join(conditions + [id_condition]), params + chunk
+            ).fetchall()
+        return rows
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ("documents", "metadatas"),
+    ) -> dict:
+        with self._lock:
+            rows = self._select("chunk_id, document, metadata", ids, where, limit, offset)
+        result = {"ids": [row[0] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [row[1] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[2]) if row[2] else None for row in rows]
+        return result
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None):
+        with self._lock, exclusive_file_lock(self._file("write.lock")):
+            self._sync()
+            self._ensure_ids()
+            if ids is None:
+                ids = [row[0] for row in self._select("chunk_id", None, where)] if where else []
+            rows = [self._id_to_row.pop(chunk_id) for chunk_id in ids if chunk_id in self._id_to_row]
+            if not rows:
+                return
+            self._alive[rows] = 0
+            self._stale_entries += int(np.count_nonzero(self._lists[rows] >= 0))
+            self._lists[rows] = -1
+            self._drop_stale_inverted()
+            self._flush()
+            self._free_rows.extend(rows)
+            with self._conn:
+                self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+            # Tells other processes that rows were freed
+            self._write_state()
+
+    def query(
+        self,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None,
+        query_texts: Optional[List[str]] = None,
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Sequence[str] = ("documents", "metadatas", "distances"),
+    ) -> dict:
+        queries = self._normalize(
+            np.asarray(query_embeddings, dtype=np.float32) if query_embeddings is not None else self._embed(query_texts)
+        )
+        result = {key: [] for key in ["ids", *include]}
+        with self._lock:
+            self._sync()
+            size = self._state["size"]
+            allowed = None
+            if where:
+                allowed = np.array(sorted(row[0] for row in self._select("row", None, where)), dtype=np.int64)
+        if size == 0 or self._vectors is None:
+            for key in result:
+                result[key] = [[] for _ in queries]
+            return result
+
+        found = []
+        use_ivf = self._centroids is not None and self.ivf_lists > 0
+        if not use_ivf:
+            scores, rows = self._top_k(queries, n_results, size, allowed)
+            found = list(zip(scores, rows))
+        else:
+            probes = np.argsort(-(queries @ self._centroids.T), axis=1)[:, :self.ivf_probes]
+            for query, query_probes in zip(queries, probes):
+                candidates = self._probe_candidates(query_probes, size)
+                if allowed is not None:
+                    candidates = np.intersect1d(candidates, allowed, assume_unique=True)
+                scores, rows = self._top_k(query[None, :], n_results, size, candidates)
+                found.append((scores[0], rows[0]))
+
+        for scores, rows in found:
+            hits = [(float(score), int(row)) for score, row in zip(scores, rows) if np.isfinite(score)]
+            with self._lock:
+                records = {}
+                for start in range(0, len(hits), 500):
+                    chunk = [row for _, row in hits[start:start + 500]]
+                    records.update(
+                        (row[0], row[1:])
+                        for row in self._conn.execute(
+                            f"SELECT row, chunk_id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(chunk))})",
+                            chunk,
+                        )
+                    )
+            hits = [(score, row) for score, row in hits if row in records]
+            result["ids"].append([records[row][0] for _, row in hits])
+            if "documents" in include:
+                result["documents"].append([records[row][1] for _, row in hits])
+            if "metadatas" in include:
+                result["metadatas"].append([json.loads(records[row][2]) if records[row][2] else None for _, row in hits])
+            if "distances" in include:
+                result["distances"].append([max(0.0, 1.0 - score) for score, _ in hits])
+        return result
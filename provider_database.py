@@ -1,28 +1,68 @@
 import json
 import os
+import threading
 
-def load_providers():
-    data_path = os.path.join("service_providers.json")
+DATA_PATH = os.path.join("service_providers.json")
+
+def load_providers(data_path=DATA_PATH):
     with open(data_path, "r", encoding="utf-8") as f:
         providers = json.load(f)
     return providers
 
+class ProviderIndex:
+    """In-memory keyword and location index over the provider file.
+
+    The index is rebuilt only when the file's modification time or size changes,
+    so lookups never touch the disk beyond a stat call.
+    """
+
+    def __init__(self, data_path=DATA_PATH):
+        self.data_path = data_path
+        self._lock = threading.Lock()
+        self._signature = None
+        # (providers, keyword -> provider ids, location -> provider ids), swapped as one unit
+        self._state = ([], {}, {})
+        # Increases on every rebuild so dependent structures know when to refresh
+        self.version = 0
+
+    def refresh(self):
+        """Rebuilds the index if the provider file changed since the last build."""
+        stat = os.stat(self.data_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature == self._signature:
+                return
+            providers = load_providers(self.data_path)
+            keyword_postings, location_postings = {}, {}
+            for provider_id, p in enumerate(providers):
+                for keyword in set(k.casefold() for k in p["keywords"]):
+                    keyword_postings.setdefault(keyword, []).append(provider_id)
+                location_postings.setdefault(p["location"].lower(), set()).add(provider_id)
+            self._state = (providers, keyword_postings, location_postings)
+            self._signature = signature
+            self.version += 1
+
+    @property
+    def providers(self):
+        self.refresh()
+        return self._state[0]
+
+    def find(self, keywords, location=None):
+        """Returns providers having any of the keywords, optionally in one location, in file order."""
+        self.refresh()
+        providers, keyword_postings, location_postings = self._state
+        matched_ids = set()
+        for keyword in keywords:
+            matched_ids.update(keyword_postings.get(keyword.casefold(), ()))
+        if location:
+            matched_ids &= location_postings.get(location.lower(), set())
+        return [providers[provider_id] for provider_id in sorted(matched_ids)]
+
+provider_index = ProviderIndex()
+
 def find_providers(keywords, location=None):
-    providers = load_providers()
-    # Basic keyword matching: if provider's keywords intersect with query keywords
-    # Convert everything to lowercase for matching
-    query_keywords = set(k.lower() for k in keywords)
-    matched = []
-    for p in providers:
-        provider_keywords = set(k.lower() for k in p["keywords"])
-        # If intersection is not empty, it means at least one keyword matches
-        if query_keywords & provider_keywords:
-            if location:
-                # If location specified, filter by location
-                if p["location"].lower() == location.lower():
-                    matched.append(p)
-            else:
-                # No location filter, accept the match
-                matched.append(p)
-
-    return matched
\ No newline at end of file
+    # Providers whose keywords intersect with the query keywords (case-insensitive),
+    # filtered by location if one is given
+    return provider_index.find(keywords, location)
@@ -0,0 +1,44 @@
+# retrieval_filters.py
+
+import os
+from typing import Any, Dict, Optional, Sequence
+
+def build_where(
+    documents: Optional[Sequence[str]] = None,
+    file_types: Optional[Sequence[str]] = None,
+    ingested_after: Optional[float] = None,
+    ingested_before: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    """Builds a metadata filter limiting retrieval to documents, file types (e.g. "pdf") and an ingest time range."""
+    # A single string would otherwise be taken as a list of one-character names
+    for name, values in (("documents", documents), ("file_types", file_types)):
+        if isinstance(values, str):
+            raise TypeError(f"'{name}' must be a list, not a string")
+    clauses = []
+    if documents:
+        clauses.append({"file_name": {"$in": list(documents)}})
+    if file_types:
+        clauses.append({"file_type": {"$in": [file_type.lower().lstrip(".") for file_type in file_types]}})
+    if ingested_after is not None:
+        clauses.append({"ingested_at": {"$gte": int(ingested_after)}})
+    if ingested_before is not None:
+        clauses.append({"ingested_at": {"$lte": int(ingested_before)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def document_matches(file_name: str, ingested_at: float, where: Dict[str, Any]) -> bool:
+    """Checks a registered document against a build_where filter, for searches that only know file names."""
+    file_type = os.path.splitext(file_name)[1].lower().lstrip(".")
+    for clause in where.get("$and", [where]):
+        key, condition = next(iter(clause.items()))
+        if key == "file_name" and file_name not in condition["$in"]:
+            return False
+        if key == "file_type" and file_type not in condition["$in"]:
+            return False
+        if key == "ingested_at":
+            if "$gte" in condition and ingested_at < condition["$gte"]:
+                return False
+            if "$lte" in condition and ingested_at > condition["$lte"]:
+                return False
+    return True
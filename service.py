@@ -0,0 +1,353 @@
+# service.py
+"""Headless asyncio HTTP service exposing ingestion, question answering and document management.
+
+    python service.py --host 0.0.0.0 --port 8080
+
+Endpoints:
+    GET    /health
+    POST   /query            {"question": ..., "n_results": 10, "language": "en", "stream": false}
+                             optional filters: "documents", "file_types" (e.g. ["pdf"]),
+                             "ingested_after" / "ingested_before" (Unix timestamps)
+                             streamed answers are plain text, with the sources as JSON in
+                             the X-Sources header and the confidence in X-Confidence
+    GET    /documents
+    POST   /documents        multipart upload, one or more "file" fields
+    DELETE /documents/{name}  name may contain "/" (e.g. sub/a.pdf from ingest_cli.py)
+    GET    /metrics          Prometheus text format
+
+Query embeddings and cross-encoder scoring from concurrent requests are
+micro-batched: requests arriving within a short window share one model call.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional
+
+from aiohttp import web
+
+from answer_cache import CachedAnswer
+from context_packer import pack_context
+from config import load_config
+from document_processing import iter_document_splits, is_document_already_processed
+from ingestion_manifest import content_hash
+from llm_interface import call_llm
+from retrieval_filters import build_where
+from tracing import metrics, run_in_context, span, start_trace
+from utils import combine_confidence, normalize_scores, re_rank_many
+from vector_store import (
+    add_to_vector_collection,
+    answer_cache,
+    delete_document,
+    embed_queries,
+    list_document_records,
+    manifest,
+    query_collection,
+)
+
+config = load_config()
+
+class MicroBatcher:
+    """Collects items submitted within a short window and processes them with one batch call.
+
+    batch_fn receives a list of items and must return one result per item; it runs
+    on the given executor so the event loop is never blocked.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        executor: ThreadPoolExecutor,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10.0,
+    ):
+        self.batch_fn = batch_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, [item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+def _embed_batch(questions: List[str]) -> List[List[float]]:
+    embeddings = embed_queries(questions)
+    if embeddings is None:
+        raise RuntimeError("The vector store is unavailable.")
+    return embeddings
+
+def _re_rank_batch(requests) -> list:
+    return re_rank_many(
+        requests,
+        # Every candidate is ranked; pack_context stops at the token budget
+        top_k=None,
+        score_threshold=config.get("rerank_score_threshold"),
+        batch_size=config.get("rerank_batch_size", 32),
+        max_length=config.get("rerank_max_length", 512),
+    )
+
+def _is_known_document(name: str) -> bool:
+    # Listing also registers the documents of a store that predates the registry;
+    # a file whose ingestion was interrupted only has chunk rows
+    return any(record["file_name"] == name for record in list_document_records()) or bool(
+        manifest.get_chunk_ids(name)
+    )
+
+async def _iterate_in_thread(executor: ThreadPoolExecutor, make_iterator: Callable[[], Iterator[str]]):
+    """Drives a blocking iterator on the executor and yields its items on the event loop."""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def pump():
+        try:
+            for item in make_iterator():
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    loop.run_in_executor(executor, run_in_context(pump))
+    while True:
+        item = await queue.get()
+        if item is done:
+            return
+        yield item
+
+class RagService:
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.get("service_workers", 8), thread_name_prefix="rag-service"
+        )
+        window_ms = config.get("microbatch_window_ms", 10)
+        max_batch = config.get("microbatch_max_size", 32)
+        self.embed_batcher = MicroBatcher(_embed_batch, self.executor, max_batch, window_ms)
+        self.rerank_batcher = MicroBatcher(_re_rank_batch, self.executor, max_batch, window_ms)
+
+    async def _run(self, fn, *args):
+        # Runs in a copy of the request's context so spans land in its trace
+        return await asyncio.get_running_loop().run_in_executor(self.executor, run_in_context(fn), *args)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def query(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(text="The request body must be JSON")
+        if not isinstance(body, dict):
+            raise web.HTTPBadRequest(text="The request body must be a JSON object")
+        question = body.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise web.HTTPBadRequest(text="'question' is required")
+        question = question.strip()
+        try:
+            n_results = int(body.get("n_results", 10))
+        except (TypeError, ValueError):
+            raise web.HTTPBadRequest(text="'n_results' must be an integer")
+        if n_results < 1:
+            raise web.HTTPBadRequest(text="'n_results' must be at least 1")
+        language = body.get("language", "en")
+        try:
+            where = build_where(
+                documents=body.get("documents"),
+                file_types=body.get("file_types"),
+                ingested_after=body.get("ingested_after"),
+                ingested_before=body.get("ingested_before"),
+            )
+        except (TypeError, ValueError) as e:
+            raise web.HTTPBadRequest(text=f"Invalid filter: {e}")
+        with start_trace("query", language=language, n_results=n_results, filtered=where is not None):
+            return await self._answer(request, question, n_results, language, bool(body.get("stream")), where)
+
+    async def _answer(
+        self,
+        request: web.Request,
+        question: str,
+        n_results: int,
+        language: str,
+        stream: bool,
+        where: Optional[dict] = None,
+    ) -> web.StreamResponse:
+        # The batched stages run on shared worker threads, so the trace records the time waited for them
+        with span("microbatch_embed_query"):
+            question_embedding = await self.embed_batcher.submit(question)
+        cache_scope = (language, n_results, json.dumps(where, sort_keys=True))
+        cache_generation = answer_cache.generation
+        cached_answer = answer_cache.lookup(question_embedding, cache_scope)
+        if cached_answer:
+            return web.json_response({
+                "answer": cached_answer.answer,
+                "sources": cached_answer.sources,
+                "confidence": cached_answer.confidence,
+                "cached": True,
+            })
+
+        results = await self._run(query_collection, question, n_results, question_embedding, where)
+        if not results or not results["documents"][0]:
+            return web.json_response({"answer": None, "sources": [], "confidence": 0.0, "cached": False})
+        documents = results["documents"][0]
+        metadatas = results["metadatas"][0]
+        retrieval_scores = normalize_scores(results["distances"][0])
+        with span("microbatch_re_rank"):
+            _, relevant_indices, re_rank_scores = await self.rerank_batcher.submit(
+                (question, documents, results["ids"][0])
+            )
+        # Confidence reflects the best few chunks only
+        confidence_top_k = config.get("rerank_top_k", 3)
+        confidence = combine_confidence(
+            retrieval_scores, relevant_indices[:confidence_top_k], re_rank_scores[:confidence_top_k]
+        )
+        context, context_indices = pack_context(
+            documents,
+            metadatas,
+            relevant_indices,
+            re_rank_scores,
+            token_budget=config.get("context_token_budget", 1500),
+            max_overlap=config["chunk_overlap"],
+            duplicate_threshold=config.get("context_duplicate_threshold", 0.8),
+        )
+        sources = [
+            {
+                "file_name": metadatas[idx].get("file_name", "Unknown"),
+                "chunk": metadatas[idx].get("chunk"),
+                "page": metadatas[idx].get("page"),
+            }
+            for idx in context_indices
+        ]
+
+        answer_metrics = {}
+        if stream:
+            # Plain-text chunked response; sources (as JSON) and confidence go in headers
+            response = web.StreamResponse(headers={
+                "Content-Type": "text/plain; charset=utf-8",
+                "X-Confidence": f"{confidence:.4f}",
+                "X-Sources": json.dumps(sources),
+            })
+            await response.prepare(request)
+            pieces = []
+            async for piece in _iterate_in_thread(
+                self.executor, lambda: call_llm(context, question, language, metrics=answer_metrics)
+            ):
+                pieces.append(piece)
+                await response.write(piece.encode("utf-8"))
+            await response.write_eof()
+            answer = "".join(pieces)
+        else:
+            answer = await self._run(lambda: "".join(call_llm(context, question, language, metrics=answer_metrics)))
+            response = web.json_response({
+                "answer": answer,
+                "sources": sources,
+                "confidence": confidence,
+                "cached": False,
+            })
+
+        # Answers cut short by an error or left untranslated must not be reused
+        if answer and answer_metrics.get("completed"):
+            answer_cache.put(
+                question_embedding,
+                cache_scope,
+                CachedAnswer(question, answer, sources, confidence),
+                cache_generation,
+            )
+        return response
+
+    async def list_documents(self, request: web.Request) -> web.Response:
+        return web.json_response(await self._run(list_document_records))
+
+    async def ingest(self, request: web.Request) -> web.Response:
+        reader = await request.multipart()
+        results = []
+        async for part in reader:
+            if part.name != "file" or not part.filename:
+                continue
+            data = await part.read()
+            file_hash = content_hash(data)
+            if is_document_already_processed(part.filename, file_hash):
+                results.append({"file_name": part.filename, "status": "unchanged"})
+                continue
+            file = io.BytesIO(data)
+            file.name = part.filename
+            with start_trace("ingest", file_name=part.filename, size=len(data)):
+                await self._run(
+                    lambda: add_to_vector_collection(
+                        iter_document_splits(
+                            file,
+                            chunk_size=config["chunk_size"],
+                            chunk_overlap=config["chunk_overlap"],
+                        ),
+                        file.name,
+                        file_hash,
+                    )
+                )
+            # Failures are logged by the ingestion code; the registry tells us whether it completed
+            status = "ingested" if manifest.get_file_hash(part.filename) == file_hash else "failed"
+            results.append({"file_name": part.filename, "status": status})
+        if not results:
+            raise web.HTTPBadRequest(text="Upload at least one 'file' field")
+        return web.json_response(results)
+
+    async def delete(self, request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        if not await self._run(_is_known_document, name):
+            raise web.HTTPNotFound(text=f"No document named '{name}'")
+        await self._run(delete_document, name)
+        return web.json_response({"file_name": name, "status": "deleted"})
+
+def create_app() -> web.Application:
+    service = RagService()
+    app = web.Application(client_max_size=config.get("service_max_upload_mb", 512) * 1024 * 1024)
+    app.add_routes([
+        web.get("/health", service.health),
+        web.get("/metrics", service.metrics),
+        web.post("/query", service.query),
+        web.get("/documents", service.list_documents),
+        web.post("/documents", service.ingest),
+        web.delete("/documents/{name:.+}", service.delete),
+    ])
+    return app
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="RAG question answering HTTP service")
+    parser.add_argument("--host", default=config.get("service_host", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=config.get("service_port", 8080))
+    args = parser.parse_args()
+    web.run_app(create_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
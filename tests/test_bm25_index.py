@@ -0,0 +1,123 @@
+# tests/test_bm25_index.py
+
+import pickle
+
+from bm25_index import BM25Index, _decode_postings, _encode_varint, reciprocal_rank_fusion, tokenize
+
+def test_postings_round_trip_through_varints():
+    pairs = [(0, 1), (5, 3), (130, 1), (20000, 70000)]
+    data = bytearray()
+    previous = 0
+    for doc_number, frequency in pairs:
+        _encode_varint(doc_number - previous, data)
+        _encode_varint(frequency, data)
+        previous = doc_number
+    assert list(_decode_postings(bytes(data))) == pairs
+
+def test_tokenize_keeps_compound_terms_and_their_parts():
+    assert tokenize("Part AB-1234, v2.1") == ["part", "ab-1234", "ab", "1234", "v2.1", "v2", "1"]
+
+def test_search_ranks_chunks_by_matching_terms(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.bin"))
+    index.add("a_1", "the pump model AB-1234 leaks oil")
+    index.add("a_2", "the valve needs a new gasket")
+    index.add("b_1", "pump maintenance schedule for the pump room")
+    index.add("b_2", "opening hours of the service desk")
+    assert [chunk_id for chunk_id, _ in index.search("pump AB-1234")][:2] == ["a_1", "b_1"]
+    assert index.search("pump", allow=lambda chunk_id: chunk_id.startswith("b_"))[0][0] == "b_1"
+    assert index.search("unknown words") == []
+
+def test_adding_an_id_again_replaces_the_chunk(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.bin"))
+    index.add("a_1", "old text")
+    index.add("a_1", "new text")
+    assert len(index) == 1
+    assert index.search("old") == []
+    assert index.search("new")[0][0] == "a_1"
+
+def test_removed_chunks_are_compacted_away(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.bin"), compact_ratio=0.25)
+    for i in range(8):
+        index.add(f"doc_{i}", f"shared term{i}")
+    for i in range(3):
+        index.remove(f"doc_{i}")
+    # Three tombstones out of eight exceed the ratio, so the postings were rewritten
+    assert index._deleted == 0
+    assert len(index._chunk_ids) == 5
+    assert [n for n, _ in _decode_postings(bytes(index._postings["shared"]))] == [0, 1, 2, 3, 4]
+    assert "term1" not in index._postings
+    assert {chunk_id for chunk_id, _ in index.search("shared")} == {f"doc_{i}" for i in range(3, 8)}
+    assert "doc_1" not in index and "doc_5" in index
+
+def test_very_common_terms_are_skipped_when_the_query_has_others(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.bin"), max_df_ratio=0.5)
+    for i in range(10):
+        index.add(f"doc_{i}", "common words" + (" rare" if i == 7 else ""))
+    assert [chunk_id for chunk_id, _ in index.search("common rare")] == ["doc_7"]
+    # A query made only of common terms still finds something
+    assert len(index.search("common", top_k=20)) == 10
+
+def test_save_appends_to_the_log_and_a_new_instance_replays_it(tmp_path):
+    path = str(tmp_path / "bm25.bin")
+    index = BM25Index(path)
+    index.add("a_1", "alpha")
+    index.save()
+    index.add("a_2", "beta")
+    index.remove("a_1")
+    index.save()
+    with open(f"{path}.log", "rb") as f:
+        records = [pickle.load(f) for _ in range(3)]
+    assert records[0] == ("generation", 0)
+    assert [change[0] for change in records[2]] == ["add", "remove"]
+
+    reloaded = BM25Index(path)
+    assert len(reloaded) == 1
+    assert reloaded.search("beta")[0][0] == "a_2"
+    assert reloaded.search("alpha") == []
+
+def test_a_large_log_is_folded_into_a_new_snapshot(tmp_path):
+    path = str(tmp_path / "bm25.bin")
+    index = BM25Index(path, log_ratio=0.0)
+    index.add("a_1", "alpha")
+    index.save()
+    assert index._generation == 1
+    with open(path, "rb") as f:
+        assert pickle.load(f)["generation"] == 1
+    with open(f"{path}.log", "rb") as f:
+        assert pickle.load(f) == ("generation", 1)
+        assert f.read() == b""
+    assert BM25Index(path).search("alpha")[0][0] == "a_1"
+
+def test_a_partial_log_record_is_cut_off(tmp_path):
+    path = str(tmp_path / "bm25.bin")
+    index = BM25Index(path)
+    index.add("a_1", "alpha")
+    index.save()
+    with open(f"{path}.log", "ab") as f:
+        f.write(pickle.dumps([("add", "a_2", {"beta": 1})])[:-3])
+    reloaded = BM25Index(path)
+    assert len(reloaded) == 1
+    reloaded.add("a_3", "gamma")
+    reloaded.save()
+    assert {chunk_id for chunk_id, _ in BM25Index(path).search("alpha gamma")} == {"a_1", "a_3"}
+
+def test_instances_sharing_the_files_see_each_others_changes(tmp_path):
+    path = str(tmp_path / "bm25.bin")
+    first, second = BM25Index(path), BM25Index(path)
+    first.add("a_1", "apple")
+    first.save()
+    second.add("b_1", "banana")
+    second.save()
+    assert first.search("banana")[0][0] == "b_1"
+    # Unsaved changes stay on top of what another instance saved in the meantime
+    first.remove("b_1")
+    second.add("b_2", "banana bread")
+    second.save()
+    first.save()
+    for index in (first, second, BM25Index(path)):
+        assert [chunk_id for chunk_id, _ in index.search("banana")] == ["b_2"]
+        assert "a_1" in index
+
+def test_reciprocal_rank_fusion_rewards_ids_ranked_by_both():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], k=60)
+    assert [item_id for item_id, _ in fused] == ["a", "c", "b"]
@@ -0,0 +1,40 @@
+# tests/test_ingest_checkpoint.py
+
+import os
+
+from ingest_checkpoint import Checkpoint
+
+def test_finished_files_are_skipped_after_a_restart(tmp_path):
+    done, failed, pending = (tmp_path / name for name in ("done.txt", "failed.txt", "pending.txt"))
+    for path in (done, failed, pending):
+        path.write_text("text")
+    checkpoint_path = str(tmp_path / "checkpoint.jsonl")
+    checkpoint = Checkpoint(checkpoint_path)
+    checkpoint.record(str(done), "ingested", chunks=3)
+    checkpoint.record(str(failed), "failed")
+
+    resumed = Checkpoint(checkpoint_path)
+    assert resumed.is_done(str(done))
+    assert resumed.entries[str(done)]["chunks"] == 3
+    assert not resumed.is_done(str(failed))
+    assert not resumed.is_done(str(pending))
+
+def test_a_changed_file_is_ingested_again(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("text")
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    checkpoint.record(str(path), "ingested")
+    path.write_text("longer text")
+    assert not Checkpoint(checkpoint.path).is_done(str(path))
+
+def test_a_partial_last_line_is_ignored(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("text")
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    checkpoint.record(str(path), "ingested")
+    with open(checkpoint.path, "a", encoding="utf-8") as f:
+        f.write('{"path": "b.txt", "sta')
+    resumed = Checkpoint(checkpoint.path)
+    assert resumed.is_done(str(path))
+    assert list(resumed.entries) == [str(path)]
+    assert os.path.getsize(checkpoint.path) > 0
@@ -0,0 +1,64 @@
+# tests/test_numpy_vector_store.py
+
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from numpy_vector_store import NumpyCollection, where_to_sql
+
+@pytest.fixture
+def metadata_db():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE chunks (chunk_id TEXT, metadata TEXT)")
+    rows = [
+        ("a", {"file_name": "a.pdf", "file_type": "pdf", "ingested_at": 100}),
+        ("b", {"file_name": "b.txt", "file_type": "txt", "ingested_at": 200}),
+        ("c", {"file_name": "sub/c.pdf", "file_type": "pdf", "ingested_at": 300}),
+    ]
+    conn.executemany("INSERT INTO chunks VALUES (?, ?)", [(chunk_id, json.dumps(meta)) for chunk_id, meta in rows])
+    yield conn
+    conn.close()
+
+def _matching(conn, where):
+    sql, params = where_to_sql(where)
+    return sorted(row[0] for row in conn.execute(f"SELECT chunk_id FROM chunks WHERE {sql}", params))
+
+def test_where_to_sql_translates_chroma_filters(metadata_db):
+    assert _matching(metadata_db, {"file_type": "pdf"}) == ["a", "c"]
+    assert _matching(metadata_db, {"file_name": {"$in": ["b.txt", "sub/c.pdf"]}}) == ["b", "c"]
+    assert _matching(metadata_db, {"file_type": {"$nin": ["pdf"]}}) == ["b"]
+    assert _matching(metadata_db, {"ingested_at": {"$gte": 200}}) == ["b", "c"]
+    assert _matching(metadata_db, {"$and": [{"file_type": "pdf"}, {"ingested_at": {"$lt": 300}}]}) == ["a"]
+    assert _matching(metadata_db, {"$or": [{"file_type": "txt"}, {"ingested_at": {"$gt": 250}}]}) == ["b", "c"]
+    assert _matching(metadata_db, {}) == ["a", "b", "c"]
+
+def test_where_to_sql_rejects_unknown_operators():
+    with pytest.raises(ValueError):
+        where_to_sql({"file_type": {"$like": "pdf"}})
+
+def test_ivf_probing_every_list_matches_the_exact_scan(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(800, 16)).astype(np.float32)
+    ids = [f"doc_{i}" for i in range(len(vectors))]
+    exact = NumpyCollection(str(tmp_path / "exact"))
+    ivf = NumpyCollection(str(tmp_path / "ivf"), ivf_lists=4, ivf_probes=4)
+    for collection in (exact, ivf):
+        collection.upsert(ids, embeddings=vectors, documents=ids)
+        collection.delete(ids=ids[:10])
+    assert ivf._centroids is not None
+    queries = vectors[:20]
+    assert ivf.query(query_embeddings=queries, n_results=5)["ids"] == exact.query(query_embeddings=queries, n_results=5)["ids"]
+
+def test_rows_freed_by_one_instance_are_reused_by_another(tmp_path):
+    path = str(tmp_path / "shared")
+    rng = np.random.default_rng(1)
+    first, second = NumpyCollection(path), NumpyCollection(path)
+    first.upsert(["a", "b"], embeddings=rng.normal(size=(2, 4)))
+    second.upsert(["c"], embeddings=rng.normal(size=(1, 4)))
+    first.delete(ids=["a"])
+    second.upsert(["d"], embeddings=rng.normal(size=(1, 4)))
+    rows = dict(first._conn.execute("SELECT chunk_id, row FROM chunks"))
+    assert sorted(rows) == ["b", "c", "d"]
+    assert sorted(rows.values()) == [0, 1, 2]
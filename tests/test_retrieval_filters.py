@@ -0,0 +1,35 @@
+# tests/test_retrieval_filters.py
+
+import pytest
+
+from retrieval_filters import build_where, document_matches
+
+def test_build_where_without_filters_is_none():
+    assert build_where() is None
+    assert build_where(documents=[], file_types=[]) is None
+
+def test_build_where_single_condition_is_not_wrapped():
+    assert build_where(documents=["a.pdf"]) == {"file_name": {"$in": ["a.pdf"]}}
+
+def test_build_where_combines_conditions():
+    assert build_where(file_types=[".PDF", "txt"], ingested_after=10.7, ingested_before=20) == {
+        "$and": [
+            {"file_type": {"$in": ["pdf", "txt"]}},
+            {"ingested_at": {"$gte": 10}},
+            {"ingested_at": {"$lte": 20}},
+        ]
+    }
+
+def test_build_where_rejects_plain_strings():
+    with pytest.raises(TypeError):
+        build_where(documents="a.pdf")
+    with pytest.raises(TypeError):
+        build_where(file_types="pdf")
+
+def test_document_matches_applies_every_condition():
+    where = build_where(documents=["a.pdf", "b.txt"], file_types=["pdf"], ingested_after=100)
+    assert document_matches("a.pdf", 150, where)
+    assert not document_matches("a.pdf", 50, where)
+    assert not document_matches("b.txt", 150, where)
+    assert not document_matches("c.pdf", 150, where)
+    assert document_matches("sub/c.PDF", 0, build_where(file_types=["pdf"]))
@@ -0,0 +1,23 @@
+# tests/test_tracing.py
+
+from tracing import MetricsRegistry
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 100.0):
+        registry.observe("latency_seconds", value, stage="embed")
+    lines = registry.render_prometheus().splitlines()
+    assert lines == [
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="embed",le="0.1"} 2',
+        'latency_seconds_bucket{stage="embed",le="1"} 3',
+        'latency_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'latency_seconds_sum{stage="embed"} 100.650000',
+        'latency_seconds_count{stage="embed"} 4',
+    ]
+
+def test_counters_escape_label_values():
+    registry = MetricsRegistry()
+    registry.inc("requests_total", file='a"b\\c')
+    registry.inc("requests_total", 2, file='a"b\\c')
+    assert registry.render_prometheus() == '# TYPE requests_total counter\nrequests_total{file="a\\"b\\\\c"} 3\n'
@@ -0,0 +1,209 @@
+# tracing.py
+
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+trace_logger = logging.getLogger("tracing")
+
+class MetricsRegistry:
+    """Process-wide Prometheus-style counters and histograms, keyed by name and labels."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        # name -> labels -> [bucket counts..., overflow count, sum, count]
+        self._histograms: Dict[str, Dict[tuple, List[float]]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                # Values above the last bound land in the overflow slot and only show up in +Inf
+                state = series[key] = [0.0] * (len(self.buckets) + 3)
+            state[bisect_left(self.buckets, value)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @staticmethod
+    def _format_labels(labels: tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def render_prometheus(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{self._format_labels(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, state in series.items():
+                    cumulative = 0.0
+                    for bound, count in zip(self.buckets, state):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._format_labels(labels, ('le', f'{bound:g}'))} {cumulative:g}")
+                    lines.append(f"{name}_bucket{self._format_labels(labels, ('le', '+Inf'))} {state[-1]:g}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {state[-2]:.6f}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {state[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+class Trace:
+    """Timing spans collected for one request (a question or a document ingest).
+
+    Spans may be recorded from several threads. Per-stage totals are always kept;
+    individual spans are kept up to max_spans so long ingests stay bounded.
+    """
+
+    def __init__(self, name: str, max_spans: int = 500, **attributes):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.max_spans = max_spans
+        self.spans: List[dict] = []
+        self.stages: Dict[str, List[float]] = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, **attributes):
+        with self._lock:
+            stage = self.stages.setdefault(name, [0, 0.0])
+            stage[0] += 1
+            stage[1] += duration
+            if len(self.spans) < self.max_spans:
+                self.spans.append({
+                    "name": name,
+                    "start_ms": round((start - self._start) * 1000, 3),
+                    "duration_ms": round(duration * 1000, 3),
+                    **attributes,
+                })
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def breakdown(self) -> List[dict]:
+        """Per-stage call counts and total milliseconds, slowest stage first."""
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1][1], reverse=True)
+        return [
+            {"stage": name, "calls": int(count), "total_ms": round(seconds * 1000, 3)}
+            for name, (count, seconds) in stages
+        ]
+
+    def to_dict(self, include_spans: bool = True) -> dict:
+        result = {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "attributes": self.attributes,
+            "stages": self.breakdown(),
+        }
+        if include_spans:
+            with self._lock:
+                result["spans"] = list(self.spans)
+        return result
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def start_trace(name: str, **attributes) -> Iterator[Trace]:
+    """Collects every span recorded in this context into a new trace and logs it as JSON when done."""
+    trace = Trace(name, **attributes)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+        metrics.inc("rag_requests_total", request=name)
+        metrics.observe("rag_request_duration_seconds", trace.duration, request=name)
+        trace_logger.info(json.dumps(trace.to_dict(include_spans=False), default=str))
+
+def record_span(name: str, duration: float, start: Optional[float] = None, **attributes):
+    """Records an already measured stage in the metrics and the current trace."""
+    metrics.observe("rag_stage_duration_seconds", duration, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, start if start is not None else time.perf_counter() - duration, duration, **attributes)
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[dict]:
+    """Times the enclosed block as one stage; the yielded dict can be filled with extra attributes."""
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException:
+        metrics.inc("rag_stage_errors_total", stage=name)
+        attributes["error"] = True
+        raise
+    finally:
+        record_span(name, time.perf_counter() - start, start, **attributes)
+
+def traced(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Decorator that records every call of a function as a span."""
+    def decorator(function: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def timed_iter(items: Iterable[T], name: str) -> Iterator[T]:
+    """Yields from items, recording the time spent producing them (not consuming them) as one span."""
+    start = time.perf_counter()
+    elapsed = 0.0
+    count = 0
+    iterator = iter(items)
+    try:
+        while True:
+            step = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - step
+                return
+            elapsed += time.perf_counter() - step
+            count += 1
+            yield item
+    finally:
+        record_span(name, elapsed, start, items=count)
+
+def run_in_context(function: Callable[..., T]) -> Callable[..., T]:
+    """Binds function to a copy of the caller's context, so spans from another thread join its trace."""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, function)
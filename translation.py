@@ -0,0 +1,120 @@
+# translation.py
+
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, Optional, Protocol, Tuple
+
+from tracing import run_in_context, span
+
+if TYPE_CHECKING:
+    from deep_translator import GoogleTranslator
+
+# A sentence ends at ., ! or ? followed by whitespace, or at a line break (keeps markdown structure)
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+class TranslationBackend(Protocol):
+    def translate(self, text: str, target: str) -> str:
+        ...
+
+class GoogleTranslateBackend:
+    """Translates through Google Translate via deep-translator."""
+
+    def __init__(self):
+        self._translators: Dict[str, "GoogleTranslator"] = {}
+        self._lock = threading.Lock()
+
+    def translate(self, text: str, target: str) -> str:
+        from deep_translator import GoogleTranslator
+
+        with self._lock:
+            translator = self._translators.get(target)
+            if translator is None:
+                translator = self._translators[target] = GoogleTranslator(source='auto', target=target)
+        return translator.translate(text) or text
+
+class PassthroughBackend:
+    """Local stand-in that returns text unchanged, e.g. for tests and benchmarks."""
+
+    def translate(self, text: str, target: str) -> str:
+        return text
+
+class Translator:
+    """Translates text once per (text hash, target language), sentence by sentence when streaming."""
+
+    def __init__(self, backend: TranslationBackend, max_cache_entries: int = 10_000, max_workers: int = 4):
+        self.backend = backend
+        self.max_cache_entries = max_cache_entries
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+
+    def translate(self, text: str, target: str) -> str:
+        """Translates text, returning the original if the backend fails."""
+        return self._translate(text, target)[0]
+
+    def _translate(self, text: str, target: str) -> Tuple[str, bool]:
+        """Returns the translation and whether it succeeded; the original text when it did not."""
+        if not text.strip():
+            return text, True
+        key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), target)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key], True
+        try:
+            with span("translate", target=target, characters=len(text)):
+                translated = self.backend.translate(text, target)
+        except Exception as e:
+            logging.error(f"An error occurred during translation: {e}")
+            return text, False
+        with self._lock:
+            self._cache[key] = translated
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return translated, True
+
+    def translate_stream(self, chunks: Iterable[str], target: str, status: Optional[dict] = None) -> Iterator[str]:
+        """Translates a token stream, yielding each sentence as soon as it is translated.
+
+        Completed sentences are translated in the background while the stream keeps
+        producing the next ones; output order always matches input order.
+        Sentences the backend fails on are passed through untranslated; when a
+        status dict is given, its "translation_failed" entry is then set to True.
+        """
+        def emit(future, separator: str) -> str:
+            translated, ok = future.result()
+            if not ok and status is not None:
+                status["translation_failed"] = True
+            return translated + separator
+
+        pending = deque()
+        buffer = ""
+        for chunk in chunks:
+            buffer += chunk
+            *sentences, buffer = self._split_sentences(buffer)
+            for sentence, separator in sentences:
+                pending.append((self._executor.submit(run_in_context(self._translate), sentence, target), separator))
+            while pending and pending[0][0].done():
+                yield emit(*pending.popleft())
+        if buffer:
+            pending.append((self._executor.submit(run_in_context(self._translate), buffer, target), ""))
+        while pending:
+            yield emit(*pending.popleft())
+
+    @staticmethod
+    def _split_sentences(text: str) -> list:
+        """Splits text into (sentence, separator) pairs followed by the unfinished remainder."""
+        parts = []
+        position = 0
+        for match in SENTENCE_BOUNDARY.finditer(text):
+            # A boundary at the very end may still grow (e.g. more newlines), so leave it in the remainder
+            if match.end() == len(text):
+                break
+            parts.append((text[position:match.start()], match.group()))
+            position = match.end()
+        parts.append(text[position:])
+        return parts
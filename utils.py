@@ -1,47 +1,154 @@
 # utils.py
 
+import hashlib
 import logging
-from typing import List, Tuple
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
-from sentence_transformers import CrossEncoder
 import streamlit as st
 
+from tracing import span, traced
+
 @st.cache_resource
-def load_cross_encoder_model():
-    return CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+def load_cross_encoder_model(max_length: int = 512):
+    # Imported here because sentence_transformers (and torch) take seconds to import
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2", max_length=max_length)
+
+# Bounded LRU of (question hash, chunk id) -> raw cross-encoder score
+_score_cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+_score_cache_lock = threading.Lock()
+SCORE_CACHE_MAX_ENTRIES = 50_000
+
+def _score_pairs(
+    requests: List[Tuple[str, List[str], List[str]]], batch_size: int, max_length: int
+) -> List[List[float]]:
+    """Scores (prompt, document) pairs for one or more prompts in a single model call.
+
+    Cached scores are reused, and the remaining pairs are sorted by length so each
+    batch is padded to a similar length instead of the longest document.
+    """
+    all_scores: List[List[Optional[float]]] = []
+    missing: List[Tuple[int, int, str]] = []
+    with _score_cache_lock:
+        for request_index, (prompt, documents, ids) in enumerate(requests):
+            question_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+            scores: List[Optional[float]] = [None] * len(documents)
+            for i, chunk_id in enumerate(ids):
+                key = (question_hash, chunk_id)
+                if key in _score_cache:
+                    _score_cache.move_to_end(key)
+                    scores[i] = _score_cache[key]
+                else:
+                    missing.append((request_index, i, question_hash))
+            all_scores.append(scores)
+
+    if missing:
+        missing.sort(key=lambda item: len(requests[item[0]][1][item[1]]) + len(requests[item[0]][0]))
+        encoder_model = load_cross_encoder_model(max_length)
+        predicted = encoder_model.predict(
+            [(requests[r][0], requests[r][1][i]) for r, i, _ in missing],
+            batch_size=batch_size,
+            show_progress_bar=False,
+        )
+        with _score_cache_lock:
+            for (r, i, question_hash), score in zip(missing, predicted):
+                all_scores[r][i] = float(score)
+                _score_cache[(question_hash, requests[r][2][i])] = float(score)
+            while len(_score_cache) > SCORE_CACHE_MAX_ENTRIES:
+                _score_cache.popitem(last=False)
+    return all_scores
 
-def re_rank_cross_encoders(prompt: str, documents: List[str]) -> Tuple[str, List[int], List[float]]:
-    """Re-ranks documents using a cross-encoder model for more accurate relevance scoring."""
+def _select_top(
+    documents: List[str], scores: List[float], top_k: Optional[int], score_threshold: Optional[float]
+) -> Tuple[str, List[int], List[float]]:
+    # Normalize scores to 0-1 range
+    max_score = max(scores)
+    min_score = min(scores)
+    normalized_scores = [
+        (s - min_score) / (max_score - min_score) if max_score != min_score else 1.0
+        for s in scores
+    ]
+    # Get indices sorted by scores in descending order
+    sorted_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    if score_threshold is not None:
+        sorted_indices = [i for i in sorted_indices if scores[i] >= score_threshold]
+    # Select top documents
+    relevant_text = ""
+    relevant_text_ids = []
+    relevant_scores = []
+    for idx in sorted_indices[:top_k]:
+        relevant_text += documents[idx] + " "
+        relevant_text_ids.append(idx)
+        relevant_scores.append(normalized_scores[idx])
+    return relevant_text.strip(), relevant_text_ids, relevant_scores
+
+def re_rank_many(
+    requests: List[Tuple[str, List[str], Optional[List[str]]]],
+    top_k: Optional[int] = 3,
+    score_threshold: Optional[float] = None,
+    batch_size: int = 32,
+    max_length: int = 512,
+) -> List[Tuple[str, List[int], List[float]]]:
+    """Re-ranks the candidates of several questions with one cross-encoder pass.
+
+    Each request is (prompt, documents, ids); see re_rank_cross_encoders.
+    """
+    prepared = [
+        (prompt, documents, ids if ids is not None else [hashlib.sha256(doc.encode("utf-8")).hexdigest() for doc in documents])
+        for prompt, documents, ids in requests
+    ]
+    with span("re_rank", questions=len(prepared), documents=sum(len(request[1]) for request in prepared)):
+        all_scores = _score_pairs([request for request in prepared if request[1]], batch_size, max_length)
+    scores_iter = iter(all_scores)
+    results = []
+    for prompt, documents, ids in prepared:
+        if not documents:
+            results.append(("", [], []))
+        else:
+            results.append(_select_top(documents, next(scores_iter), top_k, score_threshold))
+    return results
+
+def re_rank_cross_encoders(
+    prompt: str,
+    documents: List[str],
+    ids: Optional[List[str]] = None,
+    top_k: Optional[int] = 3,
+    score_threshold: Optional[float] = None,
+    batch_size: int = 32,
+    max_length: int = 512,
+) -> Tuple[str, List[int], List[float]]:
+    """Re-ranks documents using a cross-encoder model for more accurate relevance scoring.
+
+    Documents whose raw cross-encoder score is below score_threshold are dropped;
+    top_k=None keeps all the others, best first.
+    Chunk ids key the score cache; the document text is hashed when none are given.
+    """
     try:
-        encoder_model = load_cross_encoder_model()
-        # Create pairs of (prompt, document)
-        pairs = [(prompt, doc) for doc in documents]
-        # Get scores
-        scores = encoder_model.predict(pairs)
-        # Normalize scores to 0-1 range
-        max_score = max(scores)
-        min_score = min(scores)
-        normalized_scores = [
-            (s - min_score) / (max_score - min_score) if max_score != min_score else 1.0
-            for s in scores
-        ]
-        # Get indices sorted by scores in descending order
-        sorted_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-        # Select top 3 documents
-        top_k = 3
-        relevant_text = ""
-        relevant_text_ids = []
-        relevant_scores = []
-        for idx in sorted_indices[:top_k]:
-            relevant_text += documents[idx] + " "
-            relevant_text_ids.append(idx)
-            relevant_scores.append(normalized_scores[idx])
-        return relevant_text.strip(), relevant_text_ids, relevant_scores
+        return re_rank_many([(prompt, documents, ids)], top_k, score_threshold, batch_size, max_length)[0]
     except Exception as e:
         logging.error(f"An error occurred during document re-ranking: {e}")
         st.error(f"An error occurred during document re-ranking: {e}")
         return "", [], []
 
+def combine_confidence(
+    retrieval_scores: List[float], relevant_indices: List[int], re_rank_scores: List[float]
+) -> float:
+    """Averages retrieval and re-rank scores of the selected documents into one confidence score."""
+    # Combine scores for the top documents
+    combined_scores = []
+    for i in range(len(relevant_indices)):
+        idx = relevant_indices[i]
+        combined_score = (retrieval_scores[idx] + re_rank_scores[i]) / 2
+        combined_scores.append(combined_score)
+    # Compute overall confidence score
+    if combined_scores:
+        return sum(combined_scores) / len(combined_scores)
+    return 0.0
+
+@traced("normalize_scores")
 def normalize_scores(distances: List[float]) -> List[float]:
     """Normalizes a list of distances to a confidence score between 0 and 1."""
     max_distance = max(distances)
@@ -0,0 +1,240 @@
+# vector_backends.py
+
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+class VectorCollection(Protocol):
+    """The subset of Chroma's Collection API that vector_store.py relies on.
+
+    Any backend returning results in Chroma's shapes can be plugged in through
+    open_collection; distances are cosine distances (0 = identical).
+    """
+
+    def count(self) -> int:
+        ...
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Sequence[str] = ...,
+    ) -> dict:
+        ...
+
+    def upsert(
+        self,
+        ids: List[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+        documents: Optional[List[str]] = None,
+        metadatas: Optional[List[dict]] = None,
+    ):
+        ...
+
+    def update(self, ids: List[str], metadatas: Optional[List[dict]] = None):
+        ...
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        ...
+
+    def query(
+        self,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None,
+        query_texts: Optional[List[str]] = None,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Sequence[str] = ...,
+    ) -> dict:
+        ...
+
+def open_chroma_collection(path: str, embedding_function, name: str = "rag_app") -> VectorCollection:
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    return client.get_or_create_collection(
+        name=name,
+        embedding_function=embedding_function,
+        metadata={"hnsw:space": "cosine"},
+    )
+
+def open_numpy_collection(
+    path: str,
+    embedding_function,
+    name: str = "rag_app",
+    dtype: str = "float16",
+    ivf_lists: int = 0,
+    ivf_probes: int = 8,
+) -> VectorCollection:
+    from numpy_vector_store import NumpyCollection
+
+    return NumpyCollection(
+        os.path.join(path, "numpy", name),
+        embedding_function=embedding_function,
+        dtype=dtype,
+        ivf_lists=ivf_lists,
+        ivf_probes=ivf_probes,
+    )
+
+BACKENDS = {
+    "chroma": open_chroma_collection,
+    "numpy": open_numpy_collection,
+}
+
+def open_collection(backend: str, path: str, embedding_function, name: str = "rag_app", **options) -> VectorCollection:
+    """Opens (creating if needed) a collection with the named backend; options go to that backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector backend '{backend}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](path, embedding_function, name=name, **options)
+
+class ShardedCollection:
+    """Spreads chunks over several collections and queries them in parallel.
+
+    Each chunk is routed by the hash of its shard_key metadata value (the file
+    name by default, or another key every chunk of a document shares, such as
+    file_type), so all chunks of one document live in one shard. Queries fan out to every shard, or only to the shards a where
+    filter on shard_key can match, and the hits are merged by distance.
+    """
+
+    def __init__(self, shards: List[VectorCollection], shard_key: str = "file_name", embedding_function=None):
+        self.shards = shards
+        self.shard_key = shard_key
+        self.embedding_function = embedding_function
+        self._executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="vector-shard")
+
+    def shard_for(self, value: Any) -> int:
+        return zlib.crc32(str(value).encode("utf-8")) % len(self.shards)
+
+    def _route(self, ids: List[str], metadatas: Optional[List[dict]]) -> Dict[int, List[int]]:
+        """Groups positions of ids by shard; chunk ids start with the file name when metadata is missing."""
+        groups: Dict[int, List[int]] = {}
+        for i, chunk_id in enumerate(ids):
+            metadata = metadatas[i] if metadatas is not None else None
+            value = (metadata or {}).get(self.shard_key)
+            if value is None:
+                value = chunk_id.rsplit("_", 1)[0]
+            groups.setdefault(self.shard_for(value), []).append(i)
+        return groups
+
+    def _shards_for(self, where: Optional[Dict[str, Any]]) -> List[int]:
+        """Shards that can hold rows matching where, judged from conditions on shard_key."""
+        everything = list(range(len(self.shards)))
+        if not where:
+            return everything
+        candidates = set(everything)
+        clauses = where.get("$and", [where])
+        for clause in clauses:
+            condition = clause.get(self.shard_key)
+            if condition is None:
+                continue
+            if not isinstance(condition, dict):
+                candidates &= {self.shard_for(condition)}
+            elif "$eq" in condition:
+                candidates &= {self.shard_for(condition["$eq"])}
+            elif "$in" in condition:
+                candidates &= {self.shard_for(value) for value in condition["$in"]}
+        return sorted(candidates)
+
+    def _fan_out(self, shard_indices: List[int], operation) -> list:
+        """Runs operation(shard index, shard) for every given shard in parallel, results in order."""
+        return list(self._executor.map(lambda i: operation(i, self.shards[i]), shard_indices))
+
+    @staticmethod
+    def _pick(values: Optional[list], positions: List[int]) -> Optional[list]:
+        return None if values is None else [values[i] for i in positions]
+
+    def count(self) -> int:
+        return sum(self._fan_out(list(range(len(self.shards))), lambda i, shard: shard.count()))
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        groups = self._route(ids, metadatas)
+        self._fan_out(
+            list(groups),
+            lambda i, shard: shard.upsert(
+                ids=self._pick(ids, groups[i]),
+                embeddings=self._pick(embeddings, groups[i]),
+                documents=self._pick(documents, groups[i]),
+                metadatas=self._pick(metadatas, groups[i]),
+            ),
+        )
+
+    def update(self, ids, metadatas=None):
+        groups = self._route(ids, metadatas)
+        self._fan_out(
+            list(groups),
+            lambda i, shard: shard.update(ids=self._pick(ids, groups[i]), metadatas=self._pick(metadatas, groups[i])),
+        )
+
+    def delete(self, ids=None, where=None):
+        # Ids do not say which shard holds them unless sharding by file name, and deleting missing ids is harmless
+        self._fan_out(self._shards_for(where), lambda i, shard: shard.delete(ids=ids, where=where))
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")) -> dict:
+        include = list(include)
+        merged: Dict[str, list] = {key: [] for key in ["ids", *include]}
+        shard_indices = self._shards_for(where)
+        if limit is None and not offset:
+            parts = self._fan_out(shard_indices, lambda i, shard: shard.get(ids=ids, where=where, include=include))
+        else:
+            # Pages run over the shards in order, so walk them one after another
+            parts, skip, remaining = [], offset or 0, limit
+            for i in shard_indices:
+                if remaining is not None and remaining <= 0:
+                    break
+                size = (
+                    self.shards[i].count() if ids is None and where is None
+                    else len(self.shards[i].get(ids=ids, where=where, include=[])["ids"])
+                )
+                if skip >= size:
+                    skip -= size
+                    continue
+                part = self.shards[i].get(ids=ids, where=where, limit=remaining, offset=skip, include=include)
+                skip = 0
+                if remaining is not None:
+                    remaining -= len(part["ids"])
+                parts.append(part)
+        for part in parts:
+            for key in merged:
+                merged[key] += part.get(key) or []
+        return merged
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None, include=("documents", "metadatas", "distances")) -> dict:
+        if query_embeddings is None:
+            # Embed once here rather than once per shard
+            query_embeddings = self.embedding_function(list(query_texts))
+        include = list(include)
+        shard_include = include if "distances" in include else include + ["distances"]
+        parts = self._fan_out(
+            self._shards_for(where),
+            lambda i, shard: shard.query(
+                query_embeddings=query_embeddings, n_results=n_results, where=where, include=shard_include
+            ),
+        )
+        merged: Dict[str, list] = {key: [] for key in ["ids", *include]}
+        for q in range(len(query_embeddings)):
+            hits = sorted(
+                (part["distances"][q][j], p, j)
+                for p, part in enumerate(parts)
+                for j in range(len(part["ids"][q]))
+            )[:n_results]
+            for key in merged:
+                merged[key].append([parts[p][key][q][j] for _, p, j in hits])
+        return merged
+
+def open_sharded_collection(
+    backend: str,
+    path: str,
+    embedding_function,
+    shards: int,
+    shard_key: str = "file_name",
+    name: str = "rag_app",
+    **options,
+) -> ShardedCollection:
+    """Opens shards named <name>_<i>_of_<shards>; changing the shard count means re-ingesting."""
+    return ShardedCollection(
+        [open_collection(backend, path, embedding_function, name=f"{name}_{i}_of_{shards}", **options) for i in range(shards)],
+        shard_key=shard_key,
+        embedding_function=embedding_function,
+    )
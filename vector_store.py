@@ -1,113 +1,541 @@
 # vector_store.py
 
+import json
 import logging
-from typing import List, Optional
+import os
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Set, TypeVar
 
-import chromadb
-from chromadb.utils.embedding_functions.ollama_embedding_function import (
-    OllamaEmbeddingFunction,
-)
 import streamlit as st
-import yaml
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+from answer_cache import SemanticAnswerCache
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from config import load_config
+from ingestion_manifest import IngestionManifest, text_hash
+from retrieval_filters import document_matches
+from tracing import run_in_context, span
 
-def load_config():
-    with open("config.yaml", "r") as f:
-        return yaml.safe_load(f)
+if TYPE_CHECKING:
+    from embeddings import OllamaEmbedder
+    from vector_backends import VectorCollection
 
 config = load_config()
 
-def get_vector_collection() -> Optional[chromadb.Collection]:
-    """Gets or creates a ChromaDB collection for vector storage."""
-    try:
-        ollama_ef = OllamaEmbeddingFunction(
+T = TypeVar("T")
+
+manifest = IngestionManifest(os.path.join(config["vector_store_path"], "ingestion_manifest.db"))
+bm25_index = BM25Index(
+    os.path.join(config["vector_store_path"], "bm25_index.bin"),
+    max_df_ratio=config.get("bm25_max_df_ratio", 0.5),
+)
+_bm25_backfill_lock = threading.Lock()
+_bm25_backfilled = False
+_registry_backfill_lock = threading.Lock()
+_registry_backfilled = False
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=config.get("answer_cache_similarity", 0.95),
+    max_entries_per_scope=config.get("answer_cache_max_entries", 256),
+)
+
+# One collection handle per process, shared by every Streamlit session and thread
+_collection_lock = threading.Lock()
+_collection: Optional["VectorCollection"] = None
+_embedder: Optional["OllamaEmbedder"] = None
+_last_health_check = 0.0
+
+def _connect() -> "VectorCollection":
+    # The backend and the embedding client are imported on first use to keep app startup fast
+    from embedding_cache import EmbeddingCache
+    from embeddings import OllamaEmbedder
+    from vector_backends import open_collection, open_sharded_collection
+
+    global _embedder, _last_health_check
+    if _embedder is None:
+        _embedder = OllamaEmbedder(
             url=config["ollama_url"],
             model_name=config["embedding_model"],
+            pool_size=config.get("ollama_pool_size", 10),
+            batch_size=config.get("embedding_batch_size", 32),
+            max_in_flight=config.get("embedding_max_in_flight", 4),
+            max_retries=config.get("embedding_max_retries", 3),
+            cache=EmbeddingCache(
+                config.get(
+                    "embedding_cache_path",
+                    os.path.join(config["vector_store_path"], "embedding_cache.db"),
+                ),
+                max_entries=config.get("embedding_cache_max_entries", 200_000),
+            ),
         )
-
-        chroma_client = chromadb.PersistentClient(path=config["vector_store_path"])
-        return chroma_client.get_or_create_collection(
+    backend = config.get("vector_backend", "chroma")
+    options = {}
+    if backend == "numpy":
+        options = {
+            "dtype": config.get("numpy_vector_dtype", "float16"),
+            "ivf_lists": config.get("numpy_ivf_lists", 0),
+            "ivf_probes": config.get("numpy_ivf_probes", 8),
+        }
+    shards = config.get("vector_shards", 1)
+    shard_key = config.get("shard_key", "file_name")
+    _check_store_layout({"backend": backend, "shards": shards, "shard_key": shard_key if shards > 1 else None})
+    if shards > 1:
+        collection = open_sharded_collection(
+            backend,
+            config["vector_store_path"],
+            _embedder,
+            shards=shards,
+            shard_key=shard_key,
             name="rag_app",
-            embedding_function=ollama_ef,
-            metadata={"hnsw:space": "cosine"},
+            **options,
         )
+    else:
+        collection = open_collection(backend, config["vector_store_path"], _embedder, name="rag_app", **options)
+    _last_health_check = time.monotonic()
+    return collection
+
+def _check_store_layout(layout: Dict[str, Any]):
+    """Refuses to open the store with a backend or sharding other than the one its documents were stored with.
+
+    Another layout opens different, empty collections, while the registry and the
+    BM25 index still list every document.
+    """
+    current = json.dumps(layout, sort_keys=True)
+    stored = manifest.get_meta("store_layout")
+    if stored is not None and stored != current and not manifest.is_empty():
+        raise RuntimeError(
+            f"The vector store at {config['vector_store_path']} was built with {stored}, "
+            f"but the configuration asks for {current}. Restore vector_backend, vector_shards and "
+            "shard_key, or set a new vector_store_path and ingest the documents again."
+        )
+    if stored != current:
+        # Stores that predate this check are taken to match the configuration they are opened with
+        manifest.set_meta("store_layout", current)
+
+def _is_healthy(collection: "VectorCollection") -> bool:
+    try:
+        collection.count()
+    except Exception as e:
+        logging.warning(f"Vector store health check failed: {e}")
+        return False
+    if _embedder is not None and not _embedder.ping():
+        _embedder.reconnect()
+    return True
+
+def reset_vector_collection():
+    """Drops the cached collection handle so the next call reconnects."""
+    global _collection
+    with _collection_lock:
+        _collection = None
+        if _embedder is not None:
+            _embedder.reconnect()
+
+def get_vector_collection() -> Optional["VectorCollection"]:
+    """Returns the process-wide vector collection, connecting on first use."""
+    global _collection, _last_health_check
+    try:
+        with _collection_lock:
+            interval = config.get("health_check_interval", 30)
+            if _collection is not None and time.monotonic() - _last_health_check > interval:
+                _last_health_check = time.monotonic()
+                if not _is_healthy(_collection):
+                    _collection = None
+            if _collection is None:
+                _collection = _connect()
+            return _collection
     except Exception as e:
         logging.error(f"An error occurred while accessing the vector collection: {e}")
         st.error(f"An error occurred while accessing the vector collection: {e}")
         return None
 
-def add_to_vector_collection(all_splits: List["Document"], file_name: str):
-    """Adds document splits to a vector collection for semantic search."""
+def _with_collection(operation: Callable[["VectorCollection"], T]) -> Optional[T]:
+    """Runs an operation on the collection, reconnecting and retrying once on failure."""
+    collection = get_vector_collection()
+    if not collection:
+        return None
     try:
+        return operation(collection)
+    except Exception as e:
+        logging.warning(f"Vector store operation failed, reconnecting: {e}")
+        reset_vector_collection()
         collection = get_vector_collection()
         if not collection:
-            return
+            return None
+        return operation(collection)
+
+def _iter_batches(items: Iterable[T], batch_size: int, max_pending: int) -> Iterator[List[T]]:
+    """Groups items into batches on a background thread that blocks once max_pending batches are waiting."""
+    batches = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            batch = []
+            for item in items:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if batch:
+                put(batch)
+        except Exception as e:
+            put((done, e))
+        finally:
+            put(done)
+
+    # Spans recorded while producing (extraction, splitting) belong to the caller's trace
+    producer = threading.Thread(target=run_in_context(produce), daemon=True)
+    add_script_run_ctx(producer)
+    producer.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                break
+            if isinstance(batch, tuple) and batch[0] is done:
+                raise batch[1]
+            yield batch
+    finally:
+        stop.set()
+
+def add_to_vector_collection(
+    all_splits: Iterable["Document"],
+    file_name: str,
+    file_hash: Optional[str] = None,
+    embed_slot: Optional[ContextManager] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+    raise_errors: bool = False,
+) -> bool:
+    """Adds document splits to a vector collection, embedding only chunks not already stored.
+
+    Splits may be a lazy iterator: they are consumed on a background thread and
+    upserted in fixed-size batches, so extraction overlaps with embedding.
+    Every stored batch is checkpointed in the manifest, so an interrupted run
+    does not embed it again. embed_slot (e.g. a semaphore) is held while
+    embedding, and on_progress receives the number of chunks handled so far.
+    Returns whether the document was stored. With raise_errors, failures are
+    raised after being logged instead of shown in the UI, so a background
+    caller can keep the cause.
+    """
+    # Chunks present in the collection for this file, so the registry can be kept in sync on failure
+    stored_chunks = None
+    try:
+        if not get_vector_collection():
+            if raise_errors:
+                raise RuntimeError("The vector store is unavailable; see the log for the connection error.")
+            return False
+
+        _ensure_registry()
+        # Stored on every chunk so retrieval can be scoped by ingest date
+        ingested_at = int(time.time())
+        previous_chunks = manifest.get_chunk_hashes(file_name)
+        stored_chunks = dict(previous_chunks)
+        is_known_file = bool(previous_chunks) or manifest.get_file_hash(file_name) is not None
+        current_chunks = {}
+        new_count = kept_count = 0
+
+        batches = _iter_batches(
+            all_splits,
+            batch_size=config.get("upsert_batch_size", 256),
+            max_pending=config.get("pipeline_max_pending_batches", 4),
+        )
+        for batch in batches:
+            new_documents, new_metadatas, new_ids = [], [], []
+            kept_documents, kept_metadatas, kept_ids = [], [], []
+            for split in batch:
+                split.metadata["ingested_at"] = ingested_at
+                chunk_hash = text_hash(split.page_content)
+                chunk_id = f"{file_name}_{chunk_hash[:16]}"
+                if chunk_id in current_chunks:
+                    # Identical text repeated within the file is only stored once
+                    continue
+                current_chunks[chunk_id] = chunk_hash
+                if chunk_id in previous_chunks:
+                    kept_documents.append(split.page_content)
+                    kept_metadatas.append(split.metadata)
+                    kept_ids.append(chunk_id)
+                else:
+                    new_documents.append(split.page_content)
+                    new_metadatas.append(split.metadata)
+                    new_ids.append(chunk_id)
+
+            if not is_known_file:
+                # Not in the manifest yet: drop any vectors left over from an earlier ingestion
+                legacy = _with_collection(
+                    lambda collection: collection.get(where={"file_name": file_name}, include=[])
+                )
+                if legacy and legacy["ids"]:
+                    _with_collection(lambda collection: collection.delete(ids=legacy["ids"]))
+                    for chunk_id in legacy["ids"]:
+                        bm25_index.remove(chunk_id)
+                is_known_file = True
+            if new_ids:
+                with embed_slot or nullcontext(), span("embed", chunks=len(new_ids)):
+                    new_embeddings = _embedder(new_documents)
+                with span("upsert", chunks=len(new_ids)):
+                    _with_collection(
+                        lambda collection: collection.upsert(
+                            documents=new_documents,
+                            embeddings=new_embeddings,
+                            metadatas=new_metadatas,
+                            ids=new_ids,
+                        )
+                    )
+                for chunk_id, document in zip(new_ids, new_documents):
+                    bm25_index.add(chunk_id, document)
+                    stored_chunks[chunk_id] = current_chunks[chunk_id]
+                manifest.add_chunks(file_name, {chunk_id: current_chunks[chunk_id] for chunk_id in new_ids})
+            if kept_ids:
+                # Unchanged chunks may have moved; refresh their metadata without re-embedding
+                _with_collection(lambda collection: collection.update(ids=kept_ids, metadatas=kept_metadatas))
+                # A run killed after checkpointing a batch may not have saved its BM25 entries
+                for chunk_id, document in zip(kept_ids, kept_documents):
+                    if chunk_id not in bm25_index:
+                        bm25_index.add(chunk_id, document)
+            # Cached answers may cite chunks that just changed
+            answer_cache.invalidate()
+            new_count += len(new_ids)
+            kept_count += len(kept_ids)
+            if on_progress:
+                on_progress(len(current_chunks))
 
-        documents, metadatas, ids = [], [], []
+        if not current_chunks:
+            if raise_errors:
+                # Nothing was stored, so the registry is left as it was
+                stored_chunks = None
+                raise ValueError(f"No text could be extracted from '{file_name}'.")
+            st.warning(f"No text could be extracted from '{file_name}'.")
+            return False
 
-        for idx, split in enumerate(all_splits):
-            documents.append(split.page_content)
-            metadatas.append(split.metadata)
-            ids.append(f"{file_name}_{idx}")
+        stale_ids = [chunk_id for chunk_id in previous_chunks if chunk_id not in current_chunks]
+        if stale_ids:
+            _with_collection(lambda collection: collection.delete(ids=stale_ids))
+            for chunk_id in stale_ids:
+                bm25_index.remove(chunk_id)
+            answer_cache.invalidate()
 
-        collection.upsert(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids,
+        manifest.record_document(file_name, file_hash, current_chunks, ingested_at)
+        bm25_index.save()
+        logging.info(
+            f"Ingested '{file_name}': {new_count} new, {kept_count} unchanged, {len(stale_ids)} removed chunks."
         )
         st.success(f"Data from '{file_name}' added to the vector store!")
+        return True
     except Exception as e:
+        if stored_chunks is not None:
+            # Register what did reach the collection; the empty file hash forces a full re-check next upload
+            manifest.record_document(file_name, None, stored_chunks, ingested_at)
+            bm25_index.save()
         logging.error(f"An error occurred while adding data to the vector store: {e}")
+        if raise_errors:
+            raise
         st.error(f"An error occurred while adding data to the vector store: {e}")
+        return False
 
-def query_collection(prompt: str, n_results: int = 10):
-    """Queries the vector collection with a given prompt to retrieve relevant documents and their distances."""
+def embed_queries(prompts: List[str]) -> Optional[List[List[float]]]:
+    """Embeds several questions in one call to the shared embedding function."""
     try:
-        collection = get_vector_collection()
-        if not collection:
+        if not get_vector_collection():
             return None
-        results = collection.query(
-            query_texts=[prompt],
-            n_results=n_results,
-            include=['documents', 'distances', 'metadatas']
-        )
-        return results
+        with span("embed_query", questions=len(prompts)):
+            return _embedder(prompts)
+    except Exception as e:
+        logging.error(f"An error occurred while embedding the question: {e}")
+        st.error(f"An error occurred while embedding the question: {e}")
+        return None
+
+def embed_query(prompt: str) -> Optional[List[float]]:
+    """Embeds a question with the shared embedding function, served from the embedding cache when possible."""
+    embeddings = embed_queries([prompt])
+    return embeddings[0] if embeddings else None
+
+def _allowed_files(where: Dict[str, Any]) -> Set[str]:
+    """Resolves a build_where filter to file names using the document registry, for the BM25 search."""
+    return {
+        record["file_name"]
+        for record in manifest.list_documents()
+        if document_matches(record["file_name"], record["ingested_at"], where)
+    }
+
+def query_collection(
+    prompt: str,
+    n_results: int = 10,
+    query_embedding: Optional[List[float]] = None,
+    where: Optional[Dict[str, Any]] = None,
+):
+    """Queries the vector collection with a given prompt to retrieve relevant documents and their distances.
+
+    Pass query_embedding when the prompt was already embedded to skip embedding it again.
+    A where filter (see build_where) is applied inside the index search, so only
+    chunks in scope count towards n_results.
+    """
+    try:
+        if query_embedding is not None:
+            query = {"query_embeddings": [query_embedding]}
+        else:
+            query = {"query_texts": [prompt]}
+        if where:
+            query["where"] = where
+        with span("query_collection", n_results=n_results):
+            results = _with_collection(
+                lambda collection: collection.query(
+                    **query,
+                    n_results=n_results,
+                    include=['documents', 'distances', 'metadatas']
+                )
+            )
+        if results is None or not config.get("hybrid_search", True):
+            return results
+        with span("lexical_fusion"):
+            return _fuse_with_lexical_results(prompt, results, n_results, where)
     except Exception as e:
         logging.error(f"An error occurred while querying the collection: {e}")
         st.error(f"An error occurred while querying the collection: {e}")
         return None
 
-def list_uploaded_documents() -> List[str]:
-    """Lists the names of uploaded documents."""
+def _ensure_bm25_index():
+    """Builds the BM25 index from the collection once if the store predates hybrid search."""
+    global _bm25_backfilled
+    with _bm25_backfill_lock:
+        if _bm25_backfilled:
+            return
+        _bm25_backfilled = True
+        if len(bm25_index):
+            return
+        total = _with_collection(lambda collection: collection.count()) or 0
+        page_size = 1000
+        for offset in range(0, total, page_size):
+            page = _with_collection(
+                lambda collection: collection.get(limit=page_size, offset=offset, include=["documents"])
+            )
+            for chunk_id, document in zip(page["ids"], page["documents"]):
+                bm25_index.add(chunk_id, document)
+        if total:
+            logging.info(f"Built BM25 index for {total} existing chunks.")
+            bm25_index.save()
+
+def _fuse_with_lexical_results(prompt: str, results, n_results: int, where: Optional[Dict[str, Any]] = None):
+    """Merges dense results with BM25 results by reciprocal rank fusion.
+
+    The returned dict keeps Chroma's query result shape. Distances are derived
+    from the fused score (0 for the best hit) so downstream score normalization
+    still ranks them correctly.
+    """
+    _ensure_bm25_index()
+    allow = None
+    if where:
+        allowed_files = _allowed_files(where)
+        allow = lambda chunk_id: chunk_id.rsplit("_", 1)[0] in allowed_files  # noqa: E731
+    lexical_ids = [chunk_id for chunk_id, _ in bm25_index.search(prompt, n_results, allow=allow)]
+    if not lexical_ids:
+        return results
+
+    candidates = {
+        chunk_id: (document, metadata)
+        for chunk_id, document, metadata in zip(
+            results["ids"][0], results["documents"][0], results["metadatas"][0]
+        )
+    }
+    fused = reciprocal_rank_fusion(
+        [results["ids"][0], lexical_ids], k=config.get("rrf_k", 60)
+    )[:n_results]
+    missing_ids = [chunk_id for chunk_id, _ in fused if chunk_id not in candidates]
+    if missing_ids:
+        # The filter is applied again so chunks without the filtered metadata stay out
+        fetched = _with_collection(
+            lambda collection: collection.get(ids=missing_ids, where=where, include=["documents", "metadatas"])
+        )
+        for chunk_id, document, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+            candidates[chunk_id] = (document, metadata)
+    fused = [(chunk_id, score) for chunk_id, score in fused if chunk_id in candidates]
+    if not fused:
+        # Every lexical hit was filtered out or is gone from the collection
+        return results
+
+    best_score = fused[0][1]
+    return {
+        "ids": [[chunk_id for chunk_id, _ in fused]],
+        "documents": [[candidates[chunk_id][0] for chunk_id, _ in fused]],
+        "metadatas": [[candidates[chunk_id][1] for chunk_id, _ in fused]],
+        "distances": [[1 - score / best_score for _, score in fused]],
+    }
+
+def _ensure_registry():
+    """Registers documents from the collection once if the store predates the document registry."""
+    global _registry_backfilled
+    with _registry_backfill_lock:
+        if _registry_backfilled:
+            return
+        _registry_backfilled = True
+        if not manifest.is_empty():
+            return
+        total = _with_collection(lambda collection: collection.count()) or 0
+        documents = {}
+        ingest_times = {}
+        page_size = 1000
+        for offset in range(0, total, page_size):
+            page = _with_collection(
+                lambda collection: collection.get(limit=page_size, offset=offset, include=["metadatas"])
+            )
+            for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+                file_name = (metadata or {}).get("file_name") or chunk_id.rsplit("_", 1)[0]
+                # Unknown chunk hashes: a re-upload replaces these chunks
+                documents.setdefault(file_name, {})[chunk_id] = ""
+                if (metadata or {}).get("ingested_at") is not None:
+                    ingest_times[file_name] = max(ingest_times.get(file_name, 0), metadata["ingested_at"])
+        for file_name, chunks in documents.items():
+            manifest.record_document(file_name, None, chunks, ingest_times.get(file_name))
+        if documents:
+            logging.info(f"Registered {len(documents)} existing documents from the collection.")
+
+def list_document_records() -> List[dict]:
+    """Lists uploaded documents with their hash, chunk count and ingest time."""
     try:
-        collection = get_vector_collection()
-        if not collection:
+        if not get_vector_collection():
             return []
-        # Fetch all IDs from the collection
-        all_ids = collection.get()["ids"]
-        # Extract document names from IDs
-        document_names = set([doc_id.rsplit("_", 1)[0] for doc_id in all_ids])
-        return sorted(list(document_names))
+        _ensure_registry()
+        return manifest.list_documents()
     except Exception as e:
         logging.error(f"An error occurred while listing documents: {e}")
         st.error(f"An error occurred while listing documents: {e}")
         return []
 
+def list_uploaded_documents() -> List[str]:
+    """Lists the names of uploaded documents."""
+    return [record["file_name"] for record in list_document_records()]
+
 def delete_document(document_name: str):
     """Deletes all vectors associated with a document."""
     try:
-        collection = get_vector_collection()
-        if not collection:
+        if not get_vector_collection():
             return
-        # Find all IDs associated with the document
-        all_ids = collection.get()["ids"]
-        ids_to_delete = [
-            doc_id for doc_id in all_ids if doc_id.startswith(f"{document_name}_")
-        ]
+        _ensure_registry()
+        # The registry knows exactly which chunks belong to the document
+        ids_to_delete = manifest.get_chunk_ids(document_name)
         if ids_to_delete:
-            collection.delete(ids=ids_to_delete)
+            _with_collection(lambda collection: collection.delete(ids=ids_to_delete))
+            manifest.remove_document(document_name)
+            for chunk_id in ids_to_delete:
+                bm25_index.remove(chunk_id)
+            bm25_index.save()
+            answer_cache.invalidate()
             st.success(f"Document '{document_name}' deleted successfully.")
         else:
+            manifest.remove_document(document_name)
             st.info(f"No data found for document '{document_name}'.")
     except Exception as e:
         logging.error(f"An error occurred while deleting the document: {e}")
-        st.error(f"An error occurred while deleting the document: {e}")
\ No newline at end of file
+        st.error(f"An error occurred while deleting the document: {e}")